@@ -3,6 +3,28 @@ import { io } from "socket.io-client";
 import { useLaserharpStore } from "@/stores/laserharp";
 import { watch } from "vue";
 
+// binary result layout: uint32 count, float32 length[count], float32 modulation[count], uint8 active[count]
+export function decodeResult(buffer) {
+  // copy the data, so the typed arrays are aligned
+  const bytes = new Uint8Array(buffer);
+  const data = bytes.slice().buffer;
+
+  const count = new DataView(data).getUint32(0, true);
+  if (count === 0) {
+    return null;
+  }
+
+  const length = new Float32Array(data, 4, count);
+  const modulation = new Float32Array(data, 4 + count * 4, count);
+  const active = new Uint8Array(data, 4 + count * 8, count);
+
+  return {
+    length: Array.from(length),
+    modulation: Array.from(modulation),
+    active: Array.from(active, value => value !== 0),
+  };
+}
+
 export class Api {
   constructor(options) {
     console.log("Creating API instance with options:", options);
@@ -18,6 +40,8 @@ export class Api {
       transports: ["websocket"],
     });
 
+    this.binary = options.binary ?? true;
+
     this._setupStore();
   }
 
@@ -27,6 +51,12 @@ export class Api {
 
     this.socket.on("connect", () => {
       laserharp.connect();
+
+      // receive the per-beam results as typed arrays instead of individual json changes
+      if (this.binary) {
+        this.emitWithResponse("app:global_state:subscribe", { encoding: "binary" })
+          .catch(error => console.error("Failed to subscribe to the binary encoding:", error));
+      }
     });
 
     this.socket.on("disconnect", () => {
@@ -46,6 +76,10 @@ export class Api {
         laserharp.globalStateChange(change);
       });
     });
+
+    this.socket.on("app:global_state:result", buffer => {
+      laserharp.updateResult(decodeResult(buffer));
+    });
   }
 
   disconnect() {
@@ -73,6 +73,14 @@ export const useLaserharpStore = defineStore("laserharp", {
           break;
       }
     },
+    updateResult(result) {
+      const state = this.image_processor?.state;
+      if (!state) {
+        return;
+      }
+
+      state.result = result;
+    },
     updateSetting(componentKey, settingKey, value) {
       const component = this[componentKey];
       if (!component) {
@@ -0,0 +1,49 @@
+import os
+import asyncio
+
+
+async def _wait_for_fd(fd: int, writable: bool = False):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def on_ready():
+        if not future.done():
+            future.set_result(None)
+
+    add, remove = (loop.add_writer, loop.remove_writer) if writable else (loop.add_reader, loop.remove_reader)
+    add(fd, on_ready)
+    try:
+        await future
+    finally:
+        remove(fd)
+
+
+async def read_available(port) -> bytes:
+    """
+    Wait until the serial port becomes readable and return all bytes that are available.
+    """
+    while True:
+        available = port.in_waiting
+        if available:
+            port.timeout = 0
+            return port.read(available)
+
+        await _wait_for_fd(port.fileno())
+
+
+async def write_all(port, data: bytes):
+    """
+    Write all data to the serial port, yielding to the event loop whenever the output buffer is full.
+    """
+    fd = port.fileno()
+    view = memoryview(data)
+
+    while view:
+        try:
+            written = os.write(fd, view)
+        except BlockingIOError:
+            written = 0
+
+        view = view[written:]
+        if view:
+            await _wait_for_fd(fd, writable=True)
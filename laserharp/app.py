@@ -1,9 +1,11 @@
 import logging
 import threading
+import asyncio
 import time
 import subprocess
 import os
 import signal
+from typing import Optional
 import numpy as np
 from perci import reactive, ReactiveDictNode
 import cv2
@@ -18,6 +20,8 @@ from .orchestrator import Orchestrator
 from .hwbutton import HWButton
 from .component import Component
 from .settings import SettingsManager
+from .latency import LatencyTracer, now_ns
+from .stream_encoder import StreamEncoder
 
 
 class LaserHarpApp(Component):
@@ -30,6 +34,7 @@ class LaserHarpApp(Component):
         # setup the settings manager
         self.settings = SettingsManager(self._global_state)
         self.settings.setup()
+        self.state["settings_restore"] = self.settings.restore_stats
 
         # setup all components
         self.ipc = IPCController("ipc", self._global_state)
@@ -49,11 +54,30 @@ class LaserHarpApp(Component):
         # self._fast_process_thread = threading.Thread(target=self._fast_process_thread_run, daemon=True)
 
         self._calibration_request = False
+        self._rollback_request = None
+
+        # optional asyncio runtime. Serial I/O, settings persistence and calibration requests share a single event loop,
+        # only the capture/processing stage keeps its own thread
+        self._use_asyncio = self.config.get("runtime", "threads") == "asyncio"
+        self._loop = None
+        self._loop_thread = None
+        self._loop_main = None
+        self._calibration_event = None
 
         self._prev_result = None
         self._prev_pitch_bend = 8192
 
-        self._debug_stream_output = None
+        # shared jpeg encoder for the camera debug stream
+        self.stream_encoder = StreamEncoder(
+            self.camera,
+            self.camera.config["stream_resolution"],
+            self.camera.config.get("stream_framerate", 15),
+            self.camera.config.get("stream_quality", 70),
+        )
+
+        # trace the latency from the sensor exposure to the midi output
+        self.latency_tracer = LatencyTracer(self.config.get("latency_window", 500))
+        self._latency_publish_time = 0.0
 
         # setup hwbutton actions
         self.hwbutton.on("poweroff", self.poweroff)
@@ -75,19 +99,19 @@ class LaserHarpApp(Component):
     def get_settings(self) -> SettingsManager:
         return self.settings
 
-    def get_debug_stream_output(self):
-        # start the debug stream if it is not running
-        if self._debug_stream_output is None:
-            self._debug_stream_output = self.camera.start_debug_stream()
-
-        return self._debug_stream_output
+    def get_stream_encoder(self) -> StreamEncoder:
+        return self.stream_encoder
 
     def start(self, force_calibration=False):
         self._status_change(["stopped"], "starting")
 
+        if self._use_asyncio:
+            self._loop = asyncio.new_event_loop()
+            self.ipc.use_event_loop(self._loop)
+
         # start all components
         logging.info("Starting components...")
-        self.settings.start()
+        self.settings.start(run_thread=not self._use_asyncio)
         self.ipc.start()
         self.din_midi.start()
         self.laser_array.start()
@@ -100,15 +124,16 @@ class LaserHarpApp(Component):
         # start all threads
         logging.info("Starting threads...")
         self._capture_thread.start()
-        self._ipc_read_thread.start()
-        self._din_midi_read_thread.start()
+        if not self._use_asyncio:
+            self._ipc_read_thread.start()
+            self._din_midi_read_thread.start()
         # self._fast_process_thread.start()
 
         # load the calibration
         logging.info("Loading calibration...")
         if self.calibrator.load() and not force_calibration:
             # use the loaded calibration
-            self.processor.set_calibration(self.calibrator.calibration)
+            self.processor.set_calibration(self.calibrator.calibration, self.calibrator.grids)
         else:
             # run a new calibration
             self.run_calibration()
@@ -116,7 +141,12 @@ class LaserHarpApp(Component):
         self._status_change(["starting"], "running")
 
         # start the calibration thread. If a calibration should be performed, this will take over now
-        self._calibrate_thread.start()
+        if self._use_asyncio:
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._loop_thread.start()
+            self._loop_main = asyncio.run_coroutine_threadsafe(self._create_main_task(), self._loop).result(timeout=1)
+        else:
+            self._calibrate_thread.start()
 
     def stop(self):
         self._status_change(["running"], "stopping")
@@ -126,8 +156,11 @@ class LaserHarpApp(Component):
 
         # stop all threads
         self._capture_thread.join(timeout=1)
-        self._ipc_read_thread.join(timeout=1)
-        self._din_midi_read_thread.join(timeout=1)
+        if self._use_asyncio:
+            self._stop_event_loop()
+        else:
+            self._ipc_read_thread.join(timeout=1)
+            self._din_midi_read_thread.join(timeout=1)
         # self._fast_process_thread.join(timeout=1)
 
         # send a standby command to the STM board
@@ -154,19 +187,28 @@ class LaserHarpApp(Component):
                 time.sleep(1)
                 continue
 
-            prev_status = self.state["status"]
-            self._status_change(["starting", "running"], "calibrating")
+            self._calibrate()
 
-            self._calibration_request = False
+    def _calibrate(self):
+        prev_status = self.state["status"]
+        self._status_change(["starting", "running"], "calibrating")
+
+        self._calibration_request = False
+        rollback_request, self._rollback_request = self._rollback_request, None
 
+        if rollback_request is not None:
+            # restore a stored calibration
+            if self.calibrator.rollback(rollback_request or None):
+                self.processor.set_calibration(self.calibrator.calibration, self.calibrator.grids)
+        else:
             # run the calibrator
             calibration = self.calibrator.calibrate(save_debug_images=self.config["save_debug_images"])
-            self.calibrator.save()
 
-            # update the processor
+            # update the processor and store the calibration together with the derived grids
             self.processor.set_calibration(calibration)
+            self.calibrator.save(self.processor.calibration_grids())
 
-            self._status_change(["calibrating"], prev_status)
+        self._status_change(["calibrating"], prev_status)
 
     def _capture_thread_run(self):
         t0 = time.time()
@@ -176,8 +218,9 @@ class LaserHarpApp(Component):
             dt = t1 - t0
             t0 = t1
 
-            # wait if we are currently starting up or calibrating
+            # wait if we are currently starting up or calibrating. Keep applying midi events in the meantime
             if self.state["status"] in ("starting", "calibrating") or self._calibration_request:
+                self.orchestrator.apply_midi_events()
                 time.sleep(0.1)
                 continue
 
@@ -195,12 +238,28 @@ class LaserHarpApp(Component):
                 py = int(frame.shape[0] / 2 + np.sin(phi) * frame.shape[0] * 0.3)
                 cv2.circle(frame, (px, py), 60, (255, 255, 255), -1)
 
+            preprocess_time = now_ns()
+
             # invoke the image processor
             result = self.processor.process(frame)
+            process_time = now_ns()
 
             # invoke the orchestrator
             self.orchestrator.process(result, dt)
 
+            # record the latencies of this frame
+            sensor_time, capture_time = self.camera.frame_timestamps
+            write_time = self.din_midi.last_write_time
+            if write_time is not None and write_time < self.orchestrator.process_time:
+                write_time = None  # nothing was sent for this frame
+
+            self.latency_tracer.record(sensor_time, capture_time, preprocess_time, process_time, self.orchestrator.process_time, write_time)
+
+            # publish the latency statistics once per second
+            if t1 - self._latency_publish_time >= 1.0:
+                self._latency_publish_time = t1
+                self.state["latency"] = self.latency_tracer.summary()
+
     def _ipc_read_thread_run(self):
         while self.state["status"] != "stopping":
             # read a message
@@ -218,13 +277,78 @@ class LaserHarpApp(Component):
             if event is None:
                 continue
 
-            # forward the event to the orchestrator
+            # queue the event for the orchestrator
             self.orchestrator.handle_midi_event(event)
 
+    async def _create_main_task(self) -> asyncio.Task:
+        return asyncio.create_task(self._run_async())
+
+    async def _run_async(self):
+        tasks = [
+            self._calibrate_task(),
+            self.settings.run_async(),
+        ]
+
+        if self.ipc.enabled:
+            tasks += [self._ipc_read_task(), self.ipc.run_writer_async()]
+        if self.din_midi.enabled:
+            tasks.append(self._din_midi_read_task())
+
+        await asyncio.gather(*tasks)
+
+    async def _cancel_async(self, task: asyncio.Task):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    def _stop_event_loop(self):
+        # cancel all tasks and stop the event loop
+        asyncio.run_coroutine_threadsafe(self._cancel_async(self._loop_main), self._loop).result(timeout=1)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join(timeout=1)
+
+        # pending ipc packets are sent synchronously when the ipc controller is stopped
+        self.ipc.use_event_loop(None)
+
+        self._loop.close()
+        self._loop = None
+        self._loop_thread = None
+        self._loop_main = None
+
+    async def _calibrate_task(self):
+        self._calibration_event = asyncio.Event()
+
+        while True:
+            # wait for a calibration request
+            if not self._calibration_request:
+                await self._calibration_event.wait()
+                self._calibration_event.clear()
+                continue
+
+            # calibrating takes several seconds, so run it outside of the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self._calibrate)
+
+    async def _ipc_read_task(self):
+        while True:
+            # invoke the hwbutton handler
+            self.hwbutton.handle_ipc(await self.ipc.read_raw_async())
+
+    async def _din_midi_read_task(self):
+        while True:
+            # queue the event for the orchestrator
+            self.orchestrator.handle_midi_event(await self.din_midi.read_async())
+
     def run_calibration(self):
-        # notify the calibration thread
+        # notify the calibration thread or task
         self._calibration_request = True
 
+        if self._loop is not None and self._calibration_event is not None:
+            self._loop.call_soon_threadsafe(self._calibration_event.set)
+
+    def rollback_calibration(self, entry_id: Optional[str] = None):
+        # an empty id restores the calibration before the current one
+        self._rollback_request = entry_id or ""
+        self.run_calibration()
+
     def poweroff(self):
         logging.info("Shutting down...")
         # send standby command to the STM board (this will also happen in the stop() method but sometimes it won't trigger properly)
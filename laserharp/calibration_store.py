@@ -0,0 +1,138 @@
+import os
+import io
+import time
+import json
+import hashlib
+import logging
+import zipfile
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import appdirs
+
+
+@dataclass
+class CalibrationRecord:
+    id: str
+    created: float
+    data: dict[str, np.ndarray]
+    quality: dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {"id": self.id, "created": self.created, "quality": self.quality}
+
+
+class CalibrationStore:
+    """
+    Stores calibrations as compressed numpy archives, grouped by a hash of the configuration they were made with.
+    Only the most recent calibrations of each configuration are kept, so a previous one can be restored at any time.
+    """
+
+    VERSION = 1
+    DEFAULT_DIRECTORY: str = os.path.abspath(os.path.join(appdirs.user_data_dir("laserharp"), "calibrations"))
+
+    def __init__(self, directory: Optional[str] = None, history: int = 5):
+        self._directory = directory or self.DEFAULT_DIRECTORY
+        self.history = history
+
+    @staticmethod
+    def config_hash(required_config: dict) -> str:
+        # tuples and lists serialize equally, so the hash only depends on the values
+        encoded = json.dumps(required_config, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+    def _path(self, config_hash: str, entry_id: str = None) -> str:
+        path = os.path.join(self._directory, config_hash)
+        if entry_id is not None:
+            path = os.path.join(path, entry_id + ".npz")
+
+        return path
+
+    def entries(self, config_hash: str) -> list[str]:
+        """
+        List the ids of all stored calibrations for a configuration, newest first.
+        """
+        path = self._path(config_hash)
+        if not os.path.isdir(path):
+            return []
+
+        return sorted((name[:-4] for name in os.listdir(path) if name.endswith(".npz")), reverse=True)
+
+    def save(self, config_hash: str, data: dict[str, np.ndarray], quality: Optional[dict[str, float]] = None) -> CalibrationRecord:
+        created = time.time()
+        quality = quality or {}
+
+        # ids are timestamps, so they sort chronologically
+        timestamp = time.time_ns()
+        while os.path.exists(self._path(config_hash, f"{timestamp:020d}")):
+            timestamp += 1
+        entry_id = f"{timestamp:020d}"
+
+        # write to a temporary file first, so a crash never leaves a partial archive behind
+        path = self._path(config_hash, entry_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            version=np.int32(self.VERSION),
+            created=np.float64(created),
+            quality=np.array(json.dumps(quality)),
+            **data,
+        )
+
+        with open(path + ".tmp", "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(path + ".tmp", path)
+
+        # remove the oldest calibrations
+        for old_id in self.entries(config_hash)[self.history :]:
+            logging.debug(f"Removing calibration {config_hash}/{old_id}")
+            os.remove(self._path(config_hash, old_id))
+
+        return CalibrationRecord(entry_id, created, dict(data), quality)
+
+    def summaries(self, config_hash: str) -> list[dict]:
+        """
+        Get the summary of all stored calibrations for a configuration, newest first. Only the metadata of each archive is
+        read, the calibration data itself is not decompressed.
+        """
+        summaries = []
+
+        for entry_id in self.entries(config_hash):
+            try:
+                with np.load(self._path(config_hash, entry_id)) as archive:
+                    if int(archive["version"]) != self.VERSION:
+                        continue
+
+                    summaries.append({"id": entry_id, "created": float(archive["created"]), "quality": json.loads(str(archive["quality"]))})
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                logging.error(f"Failed to read calibration {config_hash}/{entry_id}: {e}")
+
+        return summaries
+
+    def load(self, config_hash: str, entry_id: Optional[str] = None) -> Optional[CalibrationRecord]:
+        """
+        Load a calibration by its id or the most recent one if no id is given.
+        """
+        if entry_id is None:
+            entries = self.entries(config_hash)
+            if not entries:
+                return None
+            entry_id = entries[0]
+
+        path = self._path(config_hash, entry_id)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as archive:
+                if int(archive["version"]) != self.VERSION:
+                    logging.warning(f"Calibration {config_hash}/{entry_id} has an unsupported version")
+                    return None
+
+                data = {key: archive[key] for key in archive.files if key not in ("version", "created", "quality")}
+                return CalibrationRecord(entry_id, float(archive["created"]), data, json.loads(str(archive["quality"])))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logging.error(f"Failed to load calibration {config_hash}/{entry_id}: {e}")
+            return None
@@ -4,11 +4,13 @@ import time
 import threading
 import traceback
 from enum import Enum
+from typing import Optional
 import numpy as np
 import cv2
 from perci import ReactiveDictNode, watch
 from .component import Component
 from .events import EventEmitter
+from .latency import now_ns
 
 try:
     import libcamera
@@ -23,28 +25,39 @@ except ImportError:
 
 
 class FrameRateCounter(EventEmitter):
-    def __init__(self, update_interval: float = 1.0):
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self, update_interval: float = 1.0, nominal_interval: Optional[float] = None, window: int = 250):
         super().__init__()
 
         self._update_interval = update_interval
+        self._nominal_interval = nominal_interval
 
-        self._last_time = time.time()
+        self._last_time = None
+        self._last_update_time = None
         self._last_count = 0
         self._frame_count = 0
         self._frame_rate = 0
 
-        self._running = False
-        self._thread = None
+        # rolling window of inter-frame intervals in seconds. Only written by the thread that counts the frames
+        self._intervals = np.zeros(window, dtype=np.float64)
+        self._interval_index = 0
+        self._interval_count = 0
+        self._late_frames = 0
+
+        # local clock time of the last frame and of the last update, used to detect a stalled capture
+        self._last_frame_clock = None
+        self._last_update_clock = None
+        self._stalled = False
 
     def start(self):
-        self._running = True
-        self._thread = threading.Thread(target=self._update, daemon=True)
-        self._thread.start()
+        self._last_time = None
+        self._last_update_time = None
+        self._last_frame_clock = None
+        self._stalled = False
 
     def stop(self):
-        self._running = False
-        self._thread.join()
-        self._thread = None
+        pass
 
     def get_frame_count(self):
         return self._frame_count
@@ -52,31 +65,168 @@ class FrameRateCounter(EventEmitter):
     def get_frame_rate(self):
         return self._frame_rate
 
-    def count_frame(self):
+    def count_frame(self, timestamp: Optional[float] = None):
+        """
+        Record a frame. The timestamp (in seconds) defaults to the current time, but should be the sensor timestamp if available.
+        """
+        clock = time.monotonic()
+        if timestamp is None:
+            timestamp = clock
+
         self._frame_count += 1
+        self._last_frame_clock = clock
+        self._stalled = False
+
+        if self._last_time is None:
+            self._last_time = timestamp
+            self._last_update_time = timestamp
+            self._last_update_clock = clock
+            self._last_count = self._frame_count
+            return
+
+        # store the interval since the previous frame
+        interval = timestamp - self._last_time
+        self._last_time = timestamp
+
+        self._intervals[self._interval_index] = interval
+        self._interval_index = (self._interval_index + 1) % len(self._intervals)
+        self._interval_count = min(self._interval_count + 1, len(self._intervals))
+
+        if self._nominal_interval is not None and interval > 1.5 * self._nominal_interval:
+            self._late_frames += 1
+
+        # update the statistics once per update interval
+        dt = timestamp - self._last_update_time
+        if dt < self._update_interval:
+            return
+
+        self._last_update_time = timestamp
+        self._last_update_clock = clock
+
+        fc = self._frame_count
+        self._frame_rate = (fc - self._last_count) / dt
+        self._last_count = fc
+
+        # emit an event
+        self.emit("update", self._frame_rate)
+
+    def poll(self, now: Optional[float] = None):
+        """
+        Update the statistics if no frame arrived for a whole update interval, so the frame rate drops towards 0 while the
+        capture is stalled. Meant to be called periodically from another thread. It only writes while no frames arrive, so
+        it does not race with count_frame() in practice.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        if self._last_frame_clock is None or now - self._last_frame_clock < self._update_interval:
+            return
+
+        dt = now - self._last_update_clock
+        if dt < self._update_interval:
+            return
+
+        # advance the frame timestamp of the last update as well, so the next regular update only covers the new frames
+        self._last_update_clock = now
+        self._last_update_time += dt
+        self._stalled = True
+
+        fc = self._frame_count
+        self._frame_rate = (fc - self._last_count) / dt
+        self._last_count = fc
+
+        # emit an event
+        self.emit("update", self._frame_rate)
+
+    def get_interval_stats(self) -> dict:
+        """
+        Calculate the statistics of the inter-frame intervals in the rolling window (in milliseconds).
+        """
+        intervals = self._intervals[: self._interval_count] * 1e3
+        if len(intervals) == 0:
+            return None
+
+        stats = {f"p{p}": float(v) for p, v in zip(self.PERCENTILES, np.percentile(intervals, self.PERCENTILES))}
+        stats["max"] = float(np.max(intervals))
+        stats["window"] = len(intervals)
+
+        # time since the last frame, which keeps growing while the capture is stalled
+        stats["stalled"] = self._stalled
+        stats["since_last_frame"] = (time.monotonic() - self._last_frame_clock) * 1e3 if self._last_frame_clock is not None else None
+
+        # frames arriving later than 1.5 times the nominal interval
+        if self._nominal_interval is not None:
+            stats["late"] = int(np.count_nonzero(intervals > 1.5e3 * self._nominal_interval))
+            stats["late_total"] = self._late_frames
+
+        return stats
+
+
+class FramePool:
+    def __init__(self, size: int, shape: tuple[int, int], dtype=np.uint8):
+        if size < 2:
+            raise ValueError(f"Frame pool needs at least 2 buffers, got {size}")
+
+        self._buffers = [np.zeros(shape, dtype=dtype) for _ in range(size)]
+        self._free = list(range(size))
+        self._latest = None
+        self._in_use = None
+        self._dropped = 0
+
+        self._condition = threading.Condition()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
 
-    def _update(self):
-        self._last_time = time.time()
+    @property
+    def current(self) -> Optional[int]:
+        # index of the buffer returned by the last take()
+        return self._in_use
+
+    def acquire(self) -> tuple[int, np.ndarray]:
+        with self._condition:
+            if self._free:
+                index = self._free.pop()
+            elif self._latest is not None:
+                # all other buffers are busy, so we overwrite the pending frame
+                index = self._latest
+                self._latest = None
+                self._dropped += 1
+            else:
+                raise RuntimeError("No free frame buffer available")
+
+        return index, self._buffers[index]
 
-        while self._running:
-            # wait for one update interval
-            time.sleep(self._update_interval)
+    def publish(self, index: int):
+        with self._condition:
+            # latest frame wins. An unconsumed frame is returned to the pool
+            if self._latest is not None:
+                self._free.append(self._latest)
+                self._dropped += 1
 
-            # calculate delta time
-            t_now = time.time()
-            dt = t_now - self._last_time
-            self._last_time = t_now
+            self._latest = index
+            self._condition.notify_all()
+
+    def take(self, timeout: float = 1.0) -> np.ndarray:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._latest is not None, timeout):
+                raise TimeoutError("No new frame available within the timeout period.")
 
-            # calculate the frame rate and reset the frame counter
-            fc = self._frame_count
-            self._frame_rate = (fc - self._last_count) / dt
-            self._last_count = fc
+            # the previously taken buffer is not referenced by the consumer anymore
+            if self._in_use is not None:
+                self._free.append(self._in_use)
 
-            # emit an event
-            self.emit("update", self._frame_rate)
+            self._in_use = self._latest
+            self._latest = None
+
+        return self._buffers[self._in_use]
 
 
 class Camera(Component):
+    # padding around each region of interest, so the preprocessing kernels see the same neighbourhood as on the full frame
+    ROI_PADDING = 16
+
     class StreamingOutput(io.BufferedIOBase):
         def __init__(self):
             self.frame = None
@@ -93,13 +243,31 @@ class Camera(Component):
         self.state["status"] = "stopped"
         self.state["framerate"] = 0
 
-        self._frame_counter = FrameRateCounter(update_interval=1.0)
+        self._frame_counter = FrameRateCounter(update_interval=1.0, nominal_interval=1 / self.config["framerate"])
         self._frame_counter.on("update", self._on_frame_counter_update)
 
         self._frame = None
         self._frame_available = threading.Condition()
         self._rgb_mode = False
 
+        # the capture stage runs on its own thread and hands the latest luma frame over to the processing stage
+        w, h = self.config["resolution"]
+        self._frame_pool = FramePool(self.config.get("frame_pool_size", 3), (h, w))
+        self._capture_stage_running = False
+        self._capture_stage_thread = None
+
+        # sensor and capture timestamps (in ns) of each pool buffer and of the current frame
+        self._pool_timestamps = np.zeros((self.config.get("frame_pool_size", 3), 2), dtype=np.int64)
+        self._frame_timestamps = (0, 0)
+
+        # regions of interest (x0, y0, x1, y1) to preprocess. None means the full frame is preprocessed
+        self._roi = None
+        self._roi_points = (None, None)  # regions and output buffer of the region of interest preprocessing
+
+        # the debug stream requests copies of raw frames and preprocesses them on its own thread
+        self._debug_frame = None
+        self._debug_frame_requested = False
+
         # create a blob detector
         params = cv2.SimpleBlobDetector_Params()
         params.filterByArea = True
@@ -127,6 +295,14 @@ class Camera(Component):
     def _on_frame_counter_update(self, rate):
         # store the new frame rate in the state
         self.state["framerate"] = rate
+        self.state["frame_intervals"] = self._frame_counter.get_interval_stats()
+        self.state["dropped_frames"] = self._frame_pool.dropped
+
+    def poll_frame_rate(self):
+        """
+        Publish the frame statistics even if no frames arrive, so a stalled capture shows up in the state.
+        """
+        self._frame_counter.poll()
 
     def _update_camera_controls(self):
         logging.debug("Updating camera settings...")
@@ -175,7 +351,7 @@ class Camera(Component):
             },
             transform=transform,
             controls=controls,
-            buffer_count=1,
+            buffer_count=self.config.get("buffer_count", 4),
         )
         self._picam.align_configuration(config)
 
@@ -213,6 +389,15 @@ class Camera(Component):
     def frame_count(self):
         return self._frame_counter.get_frame_count()
 
+    @property
+    def dropped_frames(self):
+        return self._frame_pool.dropped
+
+    @property
+    def frame_timestamps(self) -> tuple[int, int]:
+        # sensor exposure and capture completion time of the last captured frame in ns
+        return self._frame_timestamps
+
     def start(self):
         if self.state["status"] != "stopped":
             raise RuntimeError("Camera is already running.")
@@ -226,6 +411,11 @@ class Camera(Component):
             # start continuous capture
             self._picam.start()
             time.sleep(2)
+
+            # start the capture stage
+            self._capture_stage_running = True
+            self._capture_stage_thread = threading.Thread(target=self._run_capture_stage, daemon=True)
+            self._capture_stage_thread.start()
         else:
             logging.info("Camera interface is disabled")
 
@@ -243,6 +433,11 @@ class Camera(Component):
 
             self.state["status"] = "stopping"
 
+            # stop the capture stage
+            self._capture_stage_running = False
+            self._capture_stage_thread.join(timeout=1)
+            self._capture_stage_thread = None
+
             # stop continuous capture
             self._picam.stop_recording()
             self._picam.stop()
@@ -287,59 +482,129 @@ class Camera(Component):
 
         return final_blob_mask
 
-    def capture(self) -> np.ndarray:
+    def _run_capture_stage(self):
+        w, h = self.config["resolution"]
+
+        while self._capture_stage_running:
+            # wait for the next completed request. The buffer is mapped in place instead of being copied by capture_array()
+            request = self._picam.capture_request()
+            capture_time = now_ns()
+
+            try:
+                index, buffer = self._frame_pool.acquire()
+
+                # store the start of exposure for latency tracing
+                self._pool_timestamps[index, 0] = request.get_metadata().get("SensorTimestamp", capture_time)
+                self._pool_timestamps[index, 1] = capture_time
+
+                with picamera2.MappedArray(request, "main") as mapped:
+                    if self._rgb_mode:
+                        # convert RGB to grayscale
+                        cv2.cvtColor(mapped.array[:h, :w], cv2.COLOR_RGB2GRAY, dst=buffer)
+                    else:
+                        # copy only the luminance plane of the YUV420 buffer
+                        np.copyto(buffer, mapped.array[:h, :w])
+            finally:
+                request.release()
+
+            # hand the frame over to the processing stage
+            self._frame_pool.publish(index)
+
+    def set_roi(self, roi: Optional[list[tuple[int, int, int, int]]]):
+        if roi is not None:
+            w, h = self.config["resolution"]
+            roi = [(max(0, x0), max(0, y0), min(w, x1), min(h, y1)) for x0, y0, x1, y1 in roi]
+            roi = [(x0, y0, x1, y1) for x0, y0, x1, y1 in roi if x0 < x1 and y0 < y1]
+
+        self._roi = roi
+
+    def wait_for_debug_frame(self, timeout: float = 1.0) -> np.ndarray:
+        """
+        Wait for the next frame and preprocess the whole frame on the calling thread. The capture stage only copies the
+        raw frame, so the debug stream does not slow down the region of interest preprocessing.
+        """
+        if self.enabled and PICAMERA2_AVAILABLE and self.state["status"] == "running":
+            with self._frame_available:
+                self._debug_frame_requested = True
+                if self._frame_available.wait_for(lambda: not self._debug_frame_requested, timeout):
+                    return self._detect_points(self._debug_frame)
+
+            self._debug_frame_requested = False
+        else:
+            time.sleep(1 / self.config["framerate"])
+
+        # return an empty frame
+        return np.zeros((self.config["resolution"][1], self.config["resolution"][0]), dtype=np.uint8)
+
+    @staticmethod
+    def _detect_points(frame_raw: np.ndarray) -> np.ndarray:
+        # find point-like blobs
+        points = cv2.filter2D(frame_raw, -1, np.array([
+            [0, -1, 0],
+            [-1, 4, -1],
+            [0, -1, 0]
+        ], dtype=np.float32))
+        points = cv2.GaussianBlur(points, (25, 25), 0)
+        points = cv2.morphologyEx(points, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        points = cv2.multiply(points, 10)
+
+        return points
+
+    def _detect_points_roi(self, frame_raw: np.ndarray, roi: list[tuple[int, int, int, int]]) -> np.ndarray:
+        h, w = frame_raw.shape
+        pad = self.ROI_PADDING
+
+        # reuse the output buffer. Only the regions are written, so everything else stays zero until the regions change
+        points_roi, points = self._roi_points
+        if points_roi is not roi or points.shape != frame_raw.shape:
+            points = np.zeros_like(frame_raw)
+            self._roi_points = (roi, points)
+
+        for x0, y0, x1, y1 in roi:
+            # preprocess a padded region and keep only its inner part
+            px0, py0 = max(0, x0 - pad), max(0, y0 - pad)
+            px1, py1 = min(w, x1 + pad), min(h, y1 + pad)
+
+            region = self._detect_points(frame_raw[py0:py1, px0:px1])
+            points[y0:y1, x0:x1] = region[y0 - py0 : y1 - py0, x0 - px0 : x1 - px0]
+
+        return points
+
+    def capture(self, timeout: float = 1.0, full_frame: bool = False) -> np.ndarray:
         if self.enabled:
             if not PICAMERA2_AVAILABLE:
                 raise RuntimeError("libcamera2 is not available. Please install it using 'apt-get install python3-picamera2'.")
             if self.state["status"] != "running":
                 raise RuntimeError("Camera is not running.")
 
-            w, h = self.config["resolution"]
-            frame_raw: np.ndarray = None
-
-            if self._rgb_mode:
-                # capture a single frame in RGB format
-                rgb: np.ndarray = self._picam.capture_array("main")
-                assert rgb.dtype == np.uint8
-                assert rgb.shape[0] == h
-                assert rgb.shape[1] == w
-                assert rgb.shape[2] == 3
-
-                # convert RGB to grayscale
-                frame_raw = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+            # take the latest frame from the capture stage. It stays valid until the next call
+            frame_raw = self._frame_pool.take(timeout)
+            sensor_time, capture_time = self._pool_timestamps[self._frame_pool.current]
+            self._frame_timestamps = (int(sensor_time), int(capture_time))
+
+            # preprocess only the regions of interest if possible
+            roi = self._roi
+            if roi is not None and not full_frame:
+                self._frame = self._detect_points_roi(frame_raw, roi)
             else:
-                # capture a single frame in YUV format
-                yuv: np.ndarray = self._picam.capture_array("main")
-                assert yuv.dtype == np.uint8
-                assert yuv.shape[0] == h * 3 // 2
-                assert yuv.shape[1] == w
-
-                # extract the luminance component
-                yuv = yuv.reshape((h * 3 // 2, w))
-                frame_raw = yuv[:h, :w]
-
-            # find point-like blobs
-            points = cv2.filter2D(frame_raw, -1, np.array([
-                [0, -1, 0],
-                [-1, 4, -1],
-                [0, -1, 0]
-            ], dtype=np.float32))
-            points = cv2.GaussianBlur(points, (25, 25), 0)
-            points = cv2.morphologyEx(points, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
-            points = cv2.multiply(points, 10)
-
-            self._frame = points
+                self._frame = self._detect_points(frame_raw)
 
         else:
             # generate a "fake" empty frame
             time.sleep(1 / self.config["framerate"])
             self._frame = np.zeros((self.config["resolution"][1], self.config["resolution"][0]), dtype=np.uint8)
+            self._frame_timestamps = (now_ns(),) * 2
 
-        # count the frame to calculate the frame rate
-        self._frame_counter.count_frame()
+        # count the frame to calculate the frame rate and jitter. Use the sensor timestamp to exclude processing delays
+        self._frame_counter.count_frame(self._frame_timestamps[0] * 1e-9)
 
         # notify all waiting threads that a new frame is available
         with self._frame_available:
+            # the raw frame buffer is reused by the capture stage, so the debug stream gets a copy
+            if self._debug_frame_requested and self.enabled:
+                self._debug_frame = frame_raw.copy()
+                self._debug_frame_requested = False
+
             self._frame_available.notify_all()
 
         return self._frame
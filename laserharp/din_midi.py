@@ -1,20 +1,42 @@
 import logging
 import time
+import threading
+from collections import deque
 import serial
 import mido
 from perci import ReactiveDictNode
 from .component import Component
 from .midi import MidiEvent
+from .latency import now_ns
+from . import aio
 
 
 class DinMidi(Component):
     BYTE_TIMEOUT = 0.01
 
-    def __init__(self, name: str, global_state: ReactiveDictNode):
+    # number of data bytes of each channel message type
+    DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+    def __init__(self, name: str, global_state: ReactiveDictNode, custom_serial=None):
         super().__init__(name, global_state)
 
+        # output buffer collecting all messages of one frame
+        self._tx_buffer = bytearray()
+        self._tx_running_status = None
+        self._tx_lock = threading.Lock()
+
+        # completion time (in ns) of the last write, used for latency tracing
+        self.last_write_time = None
+
+        # parser state of the asynchronous reader
+        self._rx_status = None
+        self._rx_data = bytearray()
+        self._rx_events = deque(maxlen=64)
+
         if not self.enabled:
             self._serial = None
+        elif custom_serial is not None:
+            self._serial = custom_serial
         else:
             self._serial = serial.Serial(
                 port=self.config["port"],
@@ -38,14 +60,64 @@ class DinMidi(Component):
 
         self._serial.close()
 
-    def send(self, event: MidiEvent, timeout=1.0):
-        data = bytearray(event.message.bytes())
+    def write(self, status: int, data1: int, data2: int = None):
+        """
+        Append a channel message to the output buffer. The status byte is omitted if it matches the previous one (running status).
+        """
+        with self._tx_lock:
+            # note off is encoded as note on with velocity 0 to extend running status runs
+            if status & 0xF0 == 0x80:
+                status = 0x90 | (status & 0x0F)
+                data2 = 0
+
+            if status != self._tx_running_status:
+                self._tx_buffer.append(status)
+                self._tx_running_status = status
+
+            self._tx_buffer.append(data1)
+            if data2 is not None:
+                self._tx_buffer.append(data2)
+
+    def queue(self, event: MidiEvent):
+        data = event.message.bytes()
+        status = data[0]
+
+        if status >= 0xF0:
+            # system messages cancel running status and are passed through as is
+            with self._tx_lock:
+                self._tx_buffer.extend(data)
+                self._tx_running_status = None
+        else:
+            self.write(*data)
+
+    def flush(self, timeout=1.0):
+        """
+        Send all buffered messages with a single write.
+        """
+        with self._tx_lock:
+            if not self._tx_buffer:
+                return
+
+            data = bytes(self._tx_buffer)
+            self._tx_buffer.clear()
+
+            # start each write with a status byte, so the receiver can resynchronize
+            self._tx_running_status = None
+
         logging.debug(f"RPI -> DIN: {data.hex(' ')}")
 
+        # output stays synchronous with the asyncio runtime: a frame is only a few bytes that fit into the driver buffer,
+        # and writing from the capture thread keeps the latency trace exact
         if self.enabled:
             self._serial.write_timeout = timeout
             self._serial.write(data)
 
+        self.last_write_time = now_ns()
+
+    def send(self, event: MidiEvent, timeout=1.0):
+        self.queue(event)
+        self.flush(timeout)
+
     def read(self, timeout=1.0) -> MidiEvent:
         if not self.enabled:
             time.sleep(timeout)
@@ -74,3 +146,39 @@ class DinMidi(Component):
 
         logging.debug(f"DIN -> RPI: {status :02x} {data.hex(' ')}")
         return MidiEvent(0, mido.Message.from_bytes([status, *data]))
+
+    def _receive(self, data: bytes):
+        for byte in data:
+            # real-time messages may appear anywhere and are ignored
+            if byte >= 0xF8:
+                continue
+
+            if byte & 0x80:
+                if byte >= 0xF0:
+                    logging.warning(f"Invalid/Unsupported status byte: {byte}")
+                    self._rx_status = None
+                else:
+                    self._rx_status = byte
+                self._rx_data.clear()
+                continue
+
+            # skip data bytes without a known status
+            if self._rx_status is None:
+                continue
+
+            self._rx_data.append(byte)
+            if len(self._rx_data) == self.DATA_LENGTHS[self._rx_status & 0xF0]:
+                logging.debug(f"DIN -> RPI: {self._rx_status :02x} {self._rx_data.hex(' ')}")
+                self._rx_events.append(MidiEvent(0, mido.Message.from_bytes([self._rx_status, *self._rx_data])))
+
+                # keep the status byte (running status)
+                self._rx_data.clear()
+
+    async def read_async(self) -> MidiEvent:
+        """
+        Wait for the next message without blocking the event loop.
+        """
+        while not self._rx_events:
+            self._receive(await aio.read_available(self._serial))
+
+        return self._rx_events.popleft()
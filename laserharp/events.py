@@ -73,3 +73,48 @@ class Ref(EventEmitter):
 
         if immediate:
             callback(self._value)
+
+
+class SPSCQueue:
+    """
+    Bounded single-producer single-consumer queue. One thread may put() while another thread calls get() without any
+    locking, as each index is only ever written by one side.
+    """
+
+    def __init__(self, capacity: int):
+        self._buffer = [None] * (capacity + 1)
+        self._head = 0  # next read position, only written by the consumer
+        self._tail = 0  # next write position, only written by the producer
+
+        self.overflows = 0
+
+    def __len__(self):
+        return (self._tail - self._head) % len(self._buffer)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buffer) - 1
+
+    def put(self, item) -> bool:
+        tail = self._tail
+        next_tail = (tail + 1) % len(self._buffer)
+
+        # drop the item if the queue is full
+        if next_tail == self._head:
+            self.overflows += 1
+            return False
+
+        # store the item before publishing the new tail
+        self._buffer[tail] = item
+        self._tail = next_tail
+        return True
+
+    def get(self):
+        head = self._head
+        if head == self._tail:
+            return None
+
+        item = self._buffer[head]
+        self._buffer[head] = None
+        self._head = (head + 1) % len(self._buffer)
+        return item
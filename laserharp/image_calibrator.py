@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 import time
 import logging
 import os
@@ -6,10 +6,12 @@ import numpy as np
 import cv2
 import yaml
 import json
+from typing import Optional
 from perci import ReactiveDictNode
 from .camera import Camera
 from .laser_array import LaserArray
 from .component import Component
+from .calibration_store import CalibrationStore
 
 
 def _compare_config(a: dict, b: dict):
@@ -76,6 +78,16 @@ class Calibration:
 
     @staticmethod
     def from_dict(d):
+        # older versions stored straight beam lines: x = m*y + x0
+        if "a" not in d and "x0" in d:
+            return Calibration(
+                ya=d["ya"],
+                yb=d["yb"],
+                a=np.zeros(len(d["x0"])),
+                b=np.array(d["m"]),
+                c=np.array(d["x0"]),
+            )
+
         return Calibration(
             ya=d["ya"],
             yb=d["yb"],
@@ -94,9 +106,18 @@ class ImageCalibrator(Component):
 
         # load the stored calibration data
         self.calibration = None
+        self.grids = None
+        self.quality = None
+        self.record_id = None
+
+        self.store = CalibrationStore(self.config.get("store_directory"), self.config.get("history", 5))
+
+        # the calibration data is the largest setting, so keep the parsed version of the last raw value
+        self._calibration_data_cache = (None, None)
 
         self.state["calibration"] = None
         self.state["current_index"] = None
+        self.state["history"] = []
 
     def start(self):
         pass
@@ -119,8 +140,89 @@ class ImageCalibrator(Component):
             },
         }
 
-    def load(self) -> bool:
-        d = json.loads(self.settings["calibration_data"])
+    def _calibration_data(self) -> dict:
+        raw = self.settings["calibration_data"]
+
+        cached_raw, cached_data = self._calibration_data_cache
+        if raw != cached_raw:
+            cached_data = json.loads(raw)
+            self._calibration_data_cache = (raw, cached_data)
+
+        return cached_data
+
+    def config_hash(self) -> str:
+        return CalibrationStore.config_hash(self.required_config())
+
+    def _publish_history(self):
+        self.state["history"] = self.store.summaries(self.config_hash())
+
+    def _apply_record(self, record) -> bool:
+        try:
+            calibration = Calibration(
+                ya=record.data["ya"],
+                yb=record.data["yb"],
+                a=record.data["a"],
+                b=record.data["b"],
+                c=record.data["c"],
+            )
+        except (KeyError, AssertionError):
+            logging.error(f"Calibration {record.id} is invalid")
+            return False
+
+        self.calibration = calibration
+        # all other members are the image processor grids (see ImageProcessor.GRID_KEYS), which validates them itself
+        calibration_keys = {field.name for field in fields(Calibration)}
+        self.grids = {key: value for key, value in record.data.items() if key not in calibration_keys} or None
+        self.quality = record.quality
+        self.record_id = record.id
+
+        # set the calibration data in the state
+        self.state["calibration"] = self.calibration.to_dict()
+        self.state["current_index"] = None
+
+        return True
+
+    def load(self, entry_id: Optional[str] = None) -> bool:
+        """
+        Load the most recent calibration (or a specific one) that was made with the current configuration.
+        """
+        record = self.store.load(self.config_hash(), entry_id)
+        if record is not None:
+            if not self._apply_record(record):
+                return False
+
+            self._publish_history()
+            return True
+
+        if entry_id is not None:
+            logging.warning(f"Calibration {entry_id} not found")
+            return False
+
+        # fall back to the legacy calibration data setting and migrate it to the calibration store
+        if not self._load_legacy():
+            return False
+
+        self.save()
+        self.settings["calibration_data"] = "{}"
+        return True
+
+    def rollback(self, entry_id: Optional[str] = None) -> bool:
+        """
+        Restore a stored calibration. Without an id, the calibration before the current one is restored.
+        """
+        if entry_id is None:
+            entries = self.store.entries(self.config_hash())
+            if self.record_id not in entries or entries.index(self.record_id) + 1 >= len(entries):
+                logging.warning("No previous calibration available")
+                return False
+
+            entry_id = entries[entries.index(self.record_id) + 1]
+
+        logging.info(f"Rolling back to calibration {entry_id}")
+        return self.load(entry_id)
+
+    def _load_legacy(self) -> bool:
+        d = self._calibration_data()
         if not d:
             logging.warning("No calibration data available")
             return False
@@ -132,6 +234,8 @@ class ImageCalibrator(Component):
             return False
 
         self.calibration = Calibration.from_dict(d["calibration"])
+        self.grids = None
+        self.quality = None
 
         # set the calibration data in the state
         self.state["calibration"] = self.calibration.to_dict()
@@ -139,18 +243,30 @@ class ImageCalibrator(Component):
 
         return True
 
-    def save(self):
+    def save(self, grids: Optional[dict[str, np.ndarray]] = None):
+        """
+        Store the current calibration. The processor grids are stored alongside, so they do not have to be recomputed
+        when the calibration is loaded.
+        """
         if self.calibration is None:
             raise RuntimeError("Not calibrated yet")
 
-        # update the stored calibration data
-        self.settings["calibration_data"] = json.dumps(
-            {
-                "required_config": self.required_config(),
-                "calibration": self.calibration.to_dict(),
-            },
-            separators=(",", ":"),
-        )
+        if grids is not None:
+            self.grids = grids
+
+        data = {
+            "ya": self.calibration.ya,
+            "yb": self.calibration.yb,
+            "a": self.calibration.a,
+            "b": self.calibration.b,
+            "c": self.calibration.c,
+            **(self.grids or {}),
+        }
+
+        record = self.store.save(self.config_hash(), data, self.quality)
+        self.record_id = record.id
+
+        self._publish_history()
 
     def _angle_to_ypos(self, angle: float):
         fov_y = np.radians(self.camera.config["fov"][1])
@@ -158,10 +274,11 @@ class ImageCalibrator(Component):
         return angle / fov_y * height
 
     def _combined_capture(self, num_frames: int, interval: float, mode="avg"):
-        result = self.camera.capture().astype(np.float32) / 255.0
+        # calibration needs to see the whole frame, not only the regions of interest of the previous calibration
+        result = self.camera.capture(full_frame=True).astype(np.float32) / 255.0
 
         for _ in range(num_frames - 1):
-            frame = self.camera.capture().astype(np.float32) / 255.0
+            frame = self.camera.capture(full_frame=True).astype(np.float32) / 255.0
 
             if mode == "avg":
                 result += frame
@@ -175,6 +292,18 @@ class ImageCalibrator(Component):
 
         return result
 
+    @staticmethod
+    def _quality(coverage: np.ndarray, residual: np.ndarray) -> dict[str, Optional[float]]:
+        # beams that could not be fitted have no residual. NaN is not valid json, so use None if no beam was fitted at all
+        fitted = residual[~np.isnan(residual)]
+
+        return {
+            "coverage_min": float(np.min(coverage)),
+            "coverage_mean": float(np.mean(coverage)),
+            "residual_max": float(np.max(fitted)) if len(fitted) else None,
+            "residual_mean": float(np.mean(fitted)) if len(fitted) else None,
+        }
+
     def _fit_poly(self, img):
         # apply gaussian blur
         ksize = self.config["preblur"]
@@ -189,11 +318,17 @@ class ImageCalibrator(Component):
         ws = b > self.config["threshold"]
 
         # check if the minimum coverage is met
-        if np.sum(ws) / img.shape[0] < self.config["min_coverage"]:
-            return None, None, None
+        coverage = np.sum(ws) / img.shape[0]
+        if coverage < self.config["min_coverage"]:
+            return None, coverage, np.nan
 
         # fit a quadratic to the points (swap x and y because we want to fit a vertical poly line)
-        return np.polyfit(y=xs, x=ys, deg=2, w=ws)
+        coeffs = np.polyfit(y=xs, x=ys, deg=2, w=ws)
+
+        # rms distance of the point estimates to the fitted curve
+        residual = np.sqrt(np.mean((np.polyval(coeffs, ys[ws]) - xs[ws]) ** 2))
+
+        return coeffs, coverage, residual
 
     def calibrate(self, save_debug_images=False) -> Calibration:
         logging.info("Starting calibration")
@@ -220,6 +355,9 @@ class ImageCalibrator(Component):
         )
         self.state["calibration"] = calibration.to_dict()
 
+        coverage = np.zeros(len(self.laser_array), dtype=np.float32)
+        residual = np.zeros(len(self.laser_array), dtype=np.float32)
+
         # STEP 1: capture the base image
         logging.info("Capturing base image")
         self.laser_array.set_all(0)
@@ -261,10 +399,11 @@ class ImageCalibrator(Component):
 
                     m = p * 0.2
                     x0 = self.camera.resolution[0] * (0.5 + p * 0.8)
+                    coeffs, coverage[i], residual[i] = (0.0, m, x0), 1.0, 0.0
                 else:
-                    a, b, c = self._fit_poly(beam_img)
+                    coeffs, coverage[i], residual[i] = self._fit_poly(beam_img)
 
-                if a is None:
+                if coeffs is None:
                     logging.warning("Beam too weak. Continuing...")
                     continue
 
@@ -273,6 +412,7 @@ class ImageCalibrator(Component):
                 #     continue
 
                 # save the calibration data
+                a, b, c = coeffs
                 calibration.a[i] = a
                 calibration.b[i] = b
                 calibration.c[i] = c
@@ -315,6 +455,8 @@ class ImageCalibrator(Component):
         logging.info("Calibration complete")
 
         self.calibration = calibration
+        self.grids = None
+        self.quality = self._quality(coverage, residual)
         self.state["current_index"] = None
 
         return calibration
@@ -1,4 +1,8 @@
+import time
+import logging
+import threading
 from dataclasses import dataclass
+from typing import Optional
 import numpy as np
 import cv2
 from perci import ReactiveDictNode
@@ -27,40 +31,159 @@ class KalmanFilter1D:
         # Track which filters have been activated before
         self.initialized = np.zeros(self.N, dtype=bool)
 
-    def update(self, z, active):
+        # Preallocated workspace, so that updates do not allocate any temporaries
+        self._gain = np.zeros(self.N)
+        self._residual = np.zeros(self.N)
+        self._inactive = np.zeros(self.N, dtype=bool)
+        self._first_active = np.zeros(self.N, dtype=bool)
+
+    def update(self, z, active, out=None):
         """
         z: observed measurements (shape: N,)
         active: boolean array (shape: N,), indicating if the filter is active
+        out: optional array (shape: N,) to store the state estimate in. If omitted, a copy is returned
         """
         # Reset filters that are not active
-        reset_indices = ~active
-        self.x[reset_indices] = 0
-        self.P[reset_indices] = 1
-        self.initialized[reset_indices] = False
-
-        # Only update active filters
-        update_indices = active
+        np.logical_not(active, out=self._inactive)
+        np.copyto(self.x, 0, where=self._inactive)
+        np.copyto(self.P, 1, where=self._inactive)
+        np.logical_and(self.initialized, active, out=self.initialized)
 
         # For first-time activation, initialize the state estimate to the measurement
-        first_active = update_indices & ~self.initialized
-        self.x[first_active] = z[first_active]
-        self.initialized[first_active] = True
+        np.greater(active, self.initialized, out=self._first_active)
+        np.copyto(self.x, z, where=self._first_active)
+        np.logical_or(self.initialized, self._first_active, out=self.initialized)
 
         # Standard Kalman update for active indices
-        if np.any(update_indices):
-            # Predict
-            self.P[update_indices] += self.Q[update_indices]
+        # Predict
+        np.add(self.P, self.Q, out=self.P, where=active)
+
+        # Compute Kalman gain
+        np.add(self.P, self.R, out=self._gain)
+        np.divide(self.P, self._gain, out=self._gain)
+
+        # Update state
+        np.subtract(z, self.x, out=self._residual)
+        np.multiply(self._gain, self._residual, out=self._residual)
+        np.add(self.x, self._residual, out=self.x, where=active)
+
+        # Update covariance
+        np.subtract(1, self._gain, out=self._gain)
+        np.multiply(self.P, self._gain, out=self.P, where=active)
+
+        if out is None:
+            return self.x.copy()
+
+        np.copyto(out, self.x)
+        return out
 
-            # Compute Kalman gain
-            K = self.P[update_indices] / (self.P[update_indices] + self.R[update_indices])
 
-            # Update state
-            self.x[update_indices] += K * (z[update_indices] - self.x[update_indices])
+class PeakRefiner:
+    def __init__(self, num_elements):
+        self.N = num_elements
 
-            # Update covariance
-            self.P[update_indices] *= (1 - K)
+        # Preallocated workspace
+        self._rows = np.arange(self.N)
+        self._center = np.zeros(self.N, dtype=np.intp)
+        self._index = np.zeros(self.N, dtype=np.intp)
+        self._left = np.zeros(self.N, dtype=np.float32)
+        self._mid = np.zeros(self.N, dtype=np.float32)
+        self._right = np.zeros(self.N, dtype=np.float32)
+        self._curvature = np.zeros(self.N, dtype=np.float32)
+        self._offset = np.zeros(self.N, dtype=np.float32)
+        self._offset64 = np.zeros(self.N, dtype=np.float64)
+        self._valid = np.zeros(self.N, dtype=bool)
+        self._on_border = np.zeros(self.N, dtype=bool)
+
+    def refine(self, brightness, position, out=None):
+        """
+        brightness: contiguous brightness profile of each element (shape: N, samples)
+        position: sample index of each element's maximum (shape: N,)
+        out: optional array (shape: N,) to store the refined positions in
+        """
+        samples = brightness.shape[1]
+        flat_brightness = brightness.reshape(-1)
+
+        # Fit a parabola through each peak and its two neighbours
+        np.clip(position, 1, samples - 2, out=self._center)
+        np.multiply(self._rows, samples, out=self._index)
+        np.add(self._index, self._center, out=self._index)
+        np.take(flat_brightness, self._index, out=self._mid, mode="clip")
+        np.subtract(self._index, 1, out=self._index)
+        np.take(flat_brightness, self._index, out=self._left, mode="clip")
+        np.add(self._index, 2, out=self._index)
+        np.take(flat_brightness, self._index, out=self._right, mode="clip")
+
+        # The vertex offset is only valid for a proper maximum that does not lie on the border
+        np.add(self._left, self._right, out=self._curvature)
+        np.subtract(self._curvature, self._mid, out=self._curvature)
+        np.subtract(self._curvature, self._mid, out=self._curvature)
+        np.less(self._curvature, 0, out=self._valid)
+        np.not_equal(self._center, position, out=self._on_border)
+        np.greater(self._valid, self._on_border, out=self._valid)
+
+        # Compute the vertex offset
+        np.subtract(self._left, self._right, out=self._left)
+        np.multiply(self._left, 0.5, out=self._left)
+        self._offset.fill(0)
+        np.divide(self._left, self._curvature, out=self._offset, where=self._valid)
+        np.clip(self._offset, -0.5, 0.5, out=self._offset)
+
+        if out is None:
+            out = np.zeros(self.N)
+
+        # convert all operands to float64 first, as mixed type ufuncs would allocate casting buffers
+        np.copyto(out, position)
+        np.copyto(self._offset64, self._offset)
+        np.add(out, self._offset64, out=out)
+        return out
+
+
+class ResultChannel:
+    def __init__(self, num_elements, depth=4):
+        self.N = num_elements
+        self._depth = depth
 
-        return self.x.copy()
+        # Ring buffer of the latest results
+        self._active = np.zeros((depth, self.N), dtype=bool)
+        self._length = np.zeros((depth, self.N), dtype=np.float64)
+        self._modulation = np.zeros((depth, self.N), dtype=np.float64)
+
+        # Number of results written so far
+        self._sequence = 0
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def write(self, result):
+        """
+        Store a result. Must only be called from a single thread.
+        """
+        # Fill the next slot and publish it by incrementing the sequence counter afterwards
+        slot = self._sequence % self._depth
+        np.copyto(self._active[slot], result.active)
+        np.copyto(self._length[slot], result.length)
+        np.copyto(self._modulation[slot], result.modulation)
+        self._sequence += 1
+
+    def read(self, out) -> int:
+        """
+        Copy the latest result into out and return its sequence number (0 if nothing was written yet).
+        """
+        while True:
+            sequence = self._sequence
+            if sequence == 0:
+                return 0
+
+            slot = (sequence - 1) % self._depth
+            np.copyto(out.active, self._active[slot])
+            np.copyto(out.length, self._length[slot])
+            np.copyto(out.modulation, self._modulation[slot])
+
+            # Retry if the writer might have wrapped around and overwritten the slot while copying
+            if self._sequence - sequence < self._depth - 1:
+                return sequence
 
 
 class ImageProcessor(Component):
@@ -70,6 +193,9 @@ class ImageProcessor(Component):
         length: np.ndarray
         modulation: np.ndarray
 
+    # grids derived from a calibration, see calibration_grids()
+    GRID_KEYS = ("beam_xv", "beam_yv", "y_metric", "beam_map1", "beam_map2", "band_width", "mount_distance")
+
     def __init__(self, name: str, global_state: ReactiveDictNode, laser_array: LaserArray, camera: Camera):
         super().__init__(name, global_state)
 
@@ -78,18 +204,80 @@ class ImageProcessor(Component):
 
         self.calibration = None
 
-        self.filter_coeff = self._calculate_coeff()
-        self.filter_taps = np.zeros((len(self.filter_coeff), len(self.laser_array)), dtype=np.float32)
-
-        self.beam_active = np.zeros(len(self.laser_array), dtype=bool)
-        self.beam_active_duration = np.zeros(len(self.laser_array), dtype=np.float32)
+        num_beams = len(self.laser_array)
 
-        self.beam_kalman_filter = KalmanFilter1D(len(self.laser_array), process_variance=0.1, measurement_variance=1.0)
+        # the filter taps are used as a ring buffer. For each write position, the coefficients are rotated accordingly
+        self.filter_coeff = self._calculate_coeff()
+        self.filter_taps = np.zeros((len(self.filter_coeff), num_beams), dtype=np.float64)
+        self._filter_head = 0
+        n = len(self.filter_coeff)
+        self._filter_coeff_ring = self.filter_coeff[np.mod(np.arange(n)[:, np.newaxis] - np.arange(n)[np.newaxis, :], n)]
+
+        self.beam_active = np.zeros(num_beams, dtype=bool)
+        self.beam_active_duration = np.zeros(num_beams, dtype=np.float64)
+
+        self.beam_kalman_filter = KalmanFilter1D(num_beams, process_variance=0.1, measurement_variance=1.0)
+        self.beam_peak_refiner = PeakRefiner(num_beams)
+
+        # static configuration values used on every frame
+        self._frame_interval = 1 / self.camera.framerate
+        self._subpixel_peak = self.config.get("subpixel_peak", True)
+        self._length_min = self.config["length_min"]
+        self._length_max = self.config["length_max"]
+        self._modulation_gain = self.config["modulation_gain"]
+        self._modulation_delay = self.config["modulation_delay"]
+
+        # preallocated per-beam workspace. The result buffers are reused, so a result is only valid until the next frame
+        self._strength = np.zeros(num_beams, dtype=np.float32)
+        self._peak_index = np.zeros(num_beams, dtype=np.intp)
+        self._peak_end = np.zeros(num_beams, dtype=np.intp)
+        self._plateau = np.zeros(num_beams, dtype=bool)
+        self._plateau_center = np.zeros(num_beams, dtype=np.float64)
+        self._position = np.zeros(num_beams, dtype=np.float64)
+        self._metric_index = np.zeros(num_beams, dtype=np.intp)
+        self._metric_fraction = np.zeros(num_beams, dtype=np.float64)
+        self._metric_slope = np.zeros(num_beams, dtype=np.float64)
+        self._detected = np.zeros(num_beams, dtype=bool)
+        self._invalid = np.zeros(num_beams, dtype=bool)
+        self._raw_length = np.zeros(num_beams, dtype=np.float64)
+        self._inactive = np.zeros(num_beams, dtype=bool)
+        self._rising = np.zeros(num_beams, dtype=bool)
+        self._duration_factor = np.zeros(num_beams, dtype=np.float64)
+        self._result = self.Result(
+            active=np.zeros(num_beams, dtype=bool),
+            length=np.zeros(num_beams, dtype=np.float64),
+            modulation=np.zeros(num_beams, dtype=np.float64),
+        )
 
         # values initialized by set_calibration()
         self.y_metric = None
         self.beam_yv = None
         self.beam_xv = None
+        self.beam_map1 = None
+        self.beam_map2 = None
+        self.band_width = None
+        self._y_metric_slope = None
+        self._beam_image = None
+        self._beam_bands = None
+        self._brightness = None
+        self._reversed_brightness = None
+
+        # the processing thread writes each result into the channel. The reactive state is only updated at the ui rate
+        self.result_channel = ResultChannel(num_beams)
+        self._ui_rate = self.config.get("ui_rate", 15)
+        self._ui_sequence = 0
+        self._ui_result = self.Result(
+            active=np.zeros(num_beams, dtype=bool),
+            length=np.zeros(num_beams, dtype=np.float64),
+            modulation=np.zeros(num_beams, dtype=np.float64),
+        )
+        self._ui_published = self.Result(
+            active=np.zeros(num_beams, dtype=bool),
+            length=np.zeros(num_beams, dtype=np.float64),
+            modulation=np.zeros(num_beams, dtype=np.float64),
+        )
+        self._ui_running = False
+        self._ui_thread = None
 
         self.state["result"] = None
 
@@ -100,9 +288,54 @@ class ImageProcessor(Component):
             "modulation": [0.0] * len(self.laser_array),
         }
 
+        self._ui_published.active.fill(False)
+        self._ui_published.length.fill(0.0)
+        self._ui_published.modulation.fill(0.0)
+
+        self._ui_running = True
+        self._ui_thread = threading.Thread(target=self._run_ui_thread, daemon=True)
+        self._ui_thread.start()
+
     def stop(self):
+        self._ui_running = False
+        self._ui_thread.join(timeout=1)
+        self._ui_thread = None
+
         self.state["result"] = None
 
+    def _run_ui_thread(self):
+        while self._ui_running:
+            # keep publishing even if a single update fails, otherwise the ui would freeze silently
+            try:
+                self.publish_result()
+                self.camera.poll_frame_rate()
+            except Exception:
+                logging.exception("Failed to publish the image processor state")
+
+            time.sleep(1 / self._ui_rate)
+
+    def publish_result(self):
+        # get the latest result from the processing thread
+        sequence = self.result_channel.read(self._ui_result)
+        if sequence == self._ui_sequence:
+            return
+        self._ui_sequence = sequence
+
+        # inactive beams are stored as zeros
+        np.nan_to_num(self._ui_result.length, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        np.nan_to_num(self._ui_result.modulation, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+        # only write the values that changed since the last update
+        result_state = self.state["result"]
+        for key, convert in (("active", bool), ("length", float), ("modulation", float)):
+            values = getattr(self._ui_result, key)
+            published = getattr(self._ui_published, key)
+
+            for i in np.flatnonzero(values != published):
+                result_state[key][i] = convert(values[i])
+
+            np.copyto(published, values)
+
     def _calculate_coeff(self) -> np.ndarray:
         # compute number of taps
         f_sampling = self.camera.framerate
@@ -120,7 +353,43 @@ class ImageProcessor(Component):
 
         return h
 
-    def set_calibration(self, calibration: Calibration):
+    def calibration_grids(self) -> dict[str, np.ndarray]:
+        """
+        Get the grids derived from the current calibration, so they can be stored alongside it.
+        """
+        return {
+            "beam_xv": self.beam_xv,
+            "beam_yv": self.beam_yv,
+            "y_metric": self.y_metric,
+            "beam_map1": self.beam_map1,
+            "beam_map2": self.beam_map2,
+            "band_width": np.int32(self.band_width),
+            "mount_distance": np.float64(self.camera.config["mount_distance"]),
+        }
+
+    def _grids_valid(self, grids: Optional[dict[str, np.ndarray]], num_rows: int, band_width: int) -> bool:
+        if grids is None or any(key not in grids for key in self.GRID_KEYS):
+            return False
+
+        # the metric heights depend on the mount distance and the remap table on the band width, neither of which is part
+        # of the calibration itself
+        if float(grids["mount_distance"]) != float(self.camera.config["mount_distance"]) or int(grids["band_width"]) != band_width:
+            return False
+
+        shape = (num_rows, len(self.laser_array))
+        map_shape = (band_width * len(self.laser_array), num_rows)
+        return (
+            grids["beam_xv"].shape == shape
+            and grids["beam_yv"].shape == (num_rows, 1)
+            and grids["y_metric"].shape == (num_rows,)
+            and grids["beam_map1"].shape == (*map_shape, 2)
+            and grids["beam_map2"].shape == map_shape
+        )
+
+    def set_calibration(self, calibration: Calibration, grids: Optional[dict[str, np.ndarray]] = None):
+        """
+        Apply a calibration. Grids that were stored with the calibration are used directly instead of recomputing them.
+        """
         self.calibration = calibration
 
         # get all possible y coordinates
@@ -129,20 +398,79 @@ class ImageProcessor(Component):
         y_upper = np.minimum(height, calibration.yb)
         y = np.arange(y_lower, y_upper)
 
-        # map each y coordinate to an angle and its corresponding metric height
-        y_angle = (y - calibration.ya) / (calibration.yb - calibration.ya) * np.pi / 2
-        y_angle = np.clip(y_angle, 0, np.pi / 2 - 0.01)
-        y_tan = np.tan(y_angle)
-        self.y_metric = y_tan * self.camera.config["mount_distance"]
-
-        # calculate the grid of beam interception points
-        # generate the x values using the stored polynom coefficients
-        self.beam_yv = np.round(y[:, np.newaxis]).astype(np.int32)
-        self.beam_xv = np.clip(np.round(
-            calibration.a[np.newaxis, :] * y[:, np.newaxis] * y[:, np.newaxis] +
-            calibration.b[np.newaxis, :] * y[:, np.newaxis] +
-            calibration.c[np.newaxis, :]
-        ).astype(np.int32), 0, self.camera.resolution[0] - 1)
+        band_width = self.config.get("band_width", 3)
+
+        if self._grids_valid(grids, len(y), band_width):
+            self.y_metric = np.asarray(grids["y_metric"])
+            self.beam_yv = np.asarray(grids["beam_yv"], dtype=np.int32)
+            self.beam_xv = np.asarray(grids["beam_xv"], dtype=np.int32)
+            self.beam_map1 = np.asarray(grids["beam_map1"], dtype=np.int16)
+            self.beam_map2 = np.asarray(grids["beam_map2"], dtype=np.uint16)
+        else:
+            # calculate the grid of beam interception points
+            # generate the x values using the stored polynom coefficients
+            beam_x = (
+                calibration.a[np.newaxis, :] * y[:, np.newaxis] * y[:, np.newaxis] +
+                calibration.b[np.newaxis, :] * y[:, np.newaxis] +
+                calibration.c[np.newaxis, :]
+            )
+
+            # map each y coordinate to an angle and its corresponding metric height
+            y_angle = (y - calibration.ya) / (calibration.yb - calibration.ya) * np.pi / 2
+            y_angle = np.clip(y_angle, 0, np.pi / 2 - 0.01)
+            y_tan = np.tan(y_angle)
+            self.y_metric = y_tan * self.camera.config["mount_distance"]
+
+            self.beam_yv = np.round(y[:, np.newaxis]).astype(np.int32)
+            self.beam_xv = np.clip(np.round(beam_x).astype(np.int32), 0, self.camera.resolution[0] - 1)
+
+            # build a remap table that samples a horizontal band around each beam at sub-pixel positions.
+            # Remapping a frame results in a rectified beam image of shape (band_width * num_beams, height),
+            # so that each beam's brightness profile is contiguous in memory
+            band_offsets = np.arange(band_width, dtype=np.float32) - (band_width - 1) / 2
+            map_x = (band_offsets[:, np.newaxis, np.newaxis] + beam_x.T[np.newaxis, :, :]).reshape(-1, len(y)).astype(np.float32)
+            map_y = np.tile(y, (map_x.shape[0], 1)).astype(np.float32)
+            self.beam_map1, self.beam_map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        self.band_width = band_width
+
+        # slope between neighbouring metric heights for the linear interpolation of sub-pixel positions
+        self._y_metric_slope = np.append(np.diff(self.y_metric), 0.0)
+
+        # preallocate the per-frame images
+        num_beams = len(self.laser_array)
+        self._beam_image = np.zeros(self.beam_map2.shape, dtype=np.uint8)
+        self._beam_bands = [self._beam_image[i * num_beams : (i + 1) * num_beams] for i in range(band_width)]
+        self._brightness = np.zeros((num_beams, len(y)), dtype=np.float32)
+        self._reversed_brightness = np.zeros((num_beams, len(y)), dtype=np.float32)
+
+        # only preprocess the strips around the beams from now on
+        self.camera.set_roi(self._calculate_roi() if self.config.get("roi_enabled", True) else None)
+
+    def _calculate_roi(self) -> list[tuple[int, int, int, int]]:
+        if self.beam_xv.size == 0:
+            return []
+
+        width = self.camera.resolution[0]
+        margin = self.config.get("roi_margin", 16)
+
+        # all beams share the same vertical range
+        y0 = int(self.beam_yv[0, 0])
+        y1 = int(self.beam_yv[-1, 0]) + 1
+
+        # get the horizontal extent of each beam curve
+        x0 = np.clip(np.min(self.beam_xv, axis=0) - margin, 0, width)
+        x1 = np.clip(np.max(self.beam_xv, axis=0) + margin + 1, 0, width)
+
+        # merge overlapping strips
+        strips = []
+        for a, b in sorted(zip(x0.tolist(), x1.tolist())):
+            if strips and a <= strips[-1][1]:
+                strips[-1][1] = max(strips[-1][1], b)
+            else:
+                strips.append([a, b])
+
+        return [(a, y0, b, y1) for a, b in strips]
 
     @property
     def is_calibrated(self):
@@ -152,73 +480,125 @@ class ImageProcessor(Component):
         if not self.is_calibrated:
             raise RuntimeError("No calibration data available")
 
-        # get the brightness for each beam
-        brightness = frame[self.beam_yv, self.beam_xv]
+        threshold = self.settings["threshold"]
+
+        # gather a rectified image of all beams in a single remap and average across each beam's band
+        cv2.remap(frame, self.beam_map1, self.beam_map2, cv2.INTER_LINEAR, dst=self._beam_image)
+        brightness = self._brightness
+        brightness.fill(0)
+        for band in self._beam_bands:
+            cv2.accumulate(band, brightness)
+        np.multiply(brightness, 1 / self.band_width, out=brightness)
 
         # find the strongest interception point for each beam
-        strength = np.max(brightness, axis=0)
-        position = np.argmax(brightness, axis=0)
+        np.max(brightness, axis=1, out=self._strength)
+        np.argmax(brightness, axis=1, out=self._peak_index)
+        np.greater(self._strength, threshold, out=self._detected)
 
-        # apply kalman filter to the position
-        position = self.beam_kalman_filter.update(position, active=(strength > self.settings["threshold"]))
+        # refine the interception point to sub-pixel precision
+        if self._subpixel_peak:
+            self.beam_peak_refiner.refine(brightness, self._peak_index, out=self._position)
+        else:
+            np.copyto(self._position, self._peak_index)
 
-        # lookup the metric length of each beam
-        # length = self.y_metric[position]
+        # saturated interception points are flat, so use the center of the plateau instead of its first sample
+        self._locate_plateaus(brightness)
+        np.copyto(self._position, self._plateau_center, where=self._plateau)
+
+        # apply kalman filter to the position
+        self.beam_kalman_filter.update(self._position, active=self._detected, out=self._position)
 
         # lookup the metric length of each beam (with linear interpoliation to allow float indices)
-        xs = np.arange(len(self.y_metric))
-        length = np.interp(position, xs, self.y_metric)
+        length = self._raw_length
+        np.clip(self._position, 0, len(self.y_metric) - 1, out=self._position)
+        np.copyto(self._metric_index, self._position, casting="unsafe")
+        np.copyto(self._metric_fraction, self._metric_index)
+        np.subtract(self._position, self._metric_fraction, out=self._metric_fraction)
+        np.take(self.y_metric, self._metric_index, out=length, mode="clip")
+        np.take(self._y_metric_slope, self._metric_index, out=self._metric_slope, mode="clip")
+        np.multiply(self._metric_fraction, self._metric_slope, out=self._metric_fraction)
+        np.add(length, self._metric_fraction, out=length)
 
         # filter out invalid interception points
-        length[strength < self.settings["threshold"]] = np.nan
-        length[length < self.config["length_min"]] = np.nan
-        length[length > self.config["length_max"]] = np.nan
+        np.less(self._strength, threshold, out=self._invalid)
+        np.copyto(length, np.nan, where=self._invalid)
+        np.less(length, self._length_min, out=self._invalid)
+        np.copyto(length, np.nan, where=self._invalid)
+        np.greater(length, self._length_max, out=self._invalid)
+        np.copyto(length, np.nan, where=self._invalid)
 
         return length
 
+    def _locate_plateaus(self, brightness: np.ndarray):
+        # the last maximum is the first maximum of the reversed profile. A beam is only intercepted once, so
+        # everything between the first and the last maximum belongs to the same saturated plateau
+        np.copyto(self._reversed_brightness, brightness[:, ::-1])
+        np.argmax(self._reversed_brightness, axis=1, out=self._peak_end)
+        np.subtract(brightness.shape[1] - 1, self._peak_end, out=self._peak_end)
+
+        # only plateaus wider than a single sample are relevant
+        np.greater(self._peak_end, self._peak_index, out=self._plateau)
+        np.logical_and(self._plateau, self._detected, out=self._plateau)
+
+        np.add(self._peak_end, self._peak_index, out=self._peak_end)
+        np.copyto(self._plateau_center, self._peak_end)
+        np.multiply(self._plateau_center, 0.5, out=self._plateau_center)
+
     def _apply_filter(self, raw_length: np.ndarray):
+        result = self._result
+
         # store if any beam just became active
-        active = np.isfinite(raw_length)
-        rising = active & ~self.beam_active
-        self.beam_active = active
+        active = result.active
+        np.isfinite(raw_length, out=active)
+        np.logical_not(active, out=self._inactive)
+        np.greater(active, self.beam_active, out=self._rising)
+        np.copyto(self.beam_active, active)
 
         # update active duration (increment if active, reset otherwise)
-        self.beam_active_duration = np.where(active, self.beam_active_duration + 1 / self.camera.framerate, 0)
-
-        # apply a low pass filter to the beam length
-        self.filter_taps[1:] = self.filter_taps[:-1]
-        self.filter_taps[0] = raw_length
+        np.add(self.beam_active_duration, self._frame_interval, out=self.beam_active_duration)
+        np.copyto(self.beam_active_duration, 0, where=self._inactive)
 
-        # clear all taps for inactive beams
-        self.filter_taps[:, ~active] = np.nan
+        # apply a low pass filter to the beam length. Write the new value at the head of the ring buffer
+        self._filter_head = (self._filter_head + 1) % len(self.filter_coeff)
+        np.copyto(self.filter_taps[self._filter_head], raw_length)
 
-        # set all taps for beams that just became active
-        self.filter_taps[:, rising] = raw_length[rising]
+        # set all taps for beams that just became active. Taps of inactive beams are irrelevant,
+        # because they are overwritten as soon as the beam becomes active again
+        np.copyto(self.filter_taps, raw_length, where=self._rising)
 
-        # store the low frequency content as the actual length
-        length = np.nansum(self.filter_taps * self.filter_coeff[:, np.newaxis], axis=0)
-        length[~active] = np.nan  # keep NaNs
+        # store the low frequency content as the actual length (inactive beams keep their NaNs)
+        length = result.length
+        np.matmul(self._filter_coeff_ring[self._filter_head], self.filter_taps, out=length)
+        np.copyto(length, raw_length, where=self._inactive)
 
         # store the high frequency content as the modulation
-        modulation = raw_length - length
-        modulation = np.tanh(modulation * self.config["modulation_gain"])
-        modulation[~active] = 0  # inactive beams have no modulation
+        modulation = result.modulation
+        np.subtract(raw_length, length, out=modulation)
+        np.multiply(modulation, self._modulation_gain, out=modulation)
+        np.tanh(modulation, out=modulation)
+        np.copyto(modulation, 0, where=self._inactive)  # inactive beams have no modulation
 
         # apply a factor to the modulation based on the intersection duration
-        durationFactor = np.tanh((self.beam_active_duration - self.config["modulation_delay"]) * 10) * 0.5 + 0.5
-        modulation *= durationFactor
+        duration_factor = self._duration_factor
+        np.subtract(self.beam_active_duration, self._modulation_delay, out=duration_factor)
+        np.multiply(duration_factor, 10, out=duration_factor)
+        np.tanh(duration_factor, out=duration_factor)
+        np.multiply(duration_factor, 0.5, out=duration_factor)
+        np.add(duration_factor, 0.5, out=duration_factor)
+        np.multiply(modulation, duration_factor, out=modulation)
+
+        return result
 
-        return self.Result(active, length, modulation)
+    def process_frame(self, frame) -> Result:
+        # run the allocation free part of the processing. The returned result is reused for the next frame
+        raw_length = self._calculate_beam_length(frame)
+        return self._apply_filter(raw_length)
 
     def process(self, frame) -> Result:
         # process the frame
-        raw_length = self._calculate_beam_length(frame)
-        result = self._apply_filter(raw_length)
+        result = self.process_frame(frame)
 
-        # store the new result values
-        for i in range(len(self.laser_array)):
-            self.state["result"]["active"][i] = bool(result.active[i])
-            self.state["result"]["length"][i] = float(result.length[i]) if np.isfinite(result.length[i]) else 0.0
-            self.state["result"]["modulation"][i] = float(result.modulation[i]) if np.isfinite(result.modulation[i]) else 0.0
+        # hand the result over to the ui thread
+        self.result_channel.write(result)
 
         return result
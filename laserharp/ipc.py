@@ -1,16 +1,54 @@
 import logging
 import time
+import threading
+import asyncio
+import itertools
+from collections import deque
 import serial
 from perci import ReactiveDictNode
 from .component import Component
+from . import aio
 
 
 class IPCController(Component):
-    BYTE_TIMEOUT = 0.01
-
     def __init__(self, name: str, global_state: ReactiveDictNode, custom_serial=None):
         super().__init__(name, global_state)
 
+        # packets waiting for the writer thread. Packets with the same key are coalesced (last write wins)
+        self._pending = {}
+        self._pending_condition = threading.Condition()
+        self._pending_unkeyed = 0
+        self._unkeyed_ids = itertools.count()
+        self._write_queue_size = self.config.get("write_queue_size", 64)
+        self._write_lock = threading.Lock()
+
+        # number of pending packet batches taken and written, used by send_raw() to wait for the writer task
+        self._tx_taken = 0
+        self._tx_written = 0
+
+        self._writer_running = False
+        self._writer_thread = None
+        self._tx_stats_time = 0.0
+
+        # event loop of the asyncio runtime. If set, the writer runs as a task instead of a thread
+        self._loop = None
+        self._tx_event = None
+
+        self.coalesced = 0
+        self.dropped = 0
+        self.state["tx_coalesced"] = 0
+        self.state["tx_dropped"] = 0
+
+        # received bytes are framed into packets, which are queued until read_raw() is called
+        self._rx_partial = bytearray()
+        self._rx_packets = deque()
+        self._rx_queue_size = self.config.get("read_queue_size", 64)
+
+        self.rx_dropped = 0  # number of bytes discarded while resynchronizing
+        self.rx_overflows = 0  # number of packets discarded because the queue was full
+        self.state["rx_dropped"] = 0
+        self.state["rx_overflows"] = 0
+
         if not self.enabled:
             self._serial = None
         elif custom_serial is not None:
@@ -32,44 +70,227 @@ class IPCController(Component):
         if not self._serial.is_open:
             self._serial.open()
 
+        # start the writer thread. With an event loop, the runtime schedules run_writer_async() instead
+        self._writer_running = True
+        if self._loop is None:
+            self._writer_thread = threading.Thread(target=self._run_writer_thread, daemon=True)
+            self._writer_thread.start()
+
     def stop(self):
         if not self.enabled:
             return
 
+        # stop the writer thread. Pending packets are sent before closing the port
+        with self._pending_condition:
+            self._writer_running = False
+            self._pending_condition.notify_all()
+        if self._writer_thread is not None:
+            self._writer_thread.join(timeout=1)
+            self._writer_thread = None
+        self._flush()
+
         self._serial.close()
 
-    def send_raw(self, data: bytes, timeout=1.0):
-        # only short messages are supported
-        if len(data) != 4:
-            raise ValueError(f"IPC Data must be 4 bytes long, got {len(data)}")
+    def _take_pending(self) -> bytes:
+        with self._pending_condition:
+            data = b"".join(self._pending.values())
+            self._pending.clear()
+            self._pending_unkeyed = 0
+            self._tx_taken += 1
+
+        return data
 
-        # send the packet
+    def _write(self, data: bytes, timeout=1.0):
         logging.debug(f"RPI -> STM: {data.hex(' ')}")
 
         if self.enabled:
             self._serial.write_timeout = timeout
             self._serial.write(data)
 
+    def _flush(self, timeout=1.0):
+        with self._write_lock:
+            data = self._take_pending()
+            if data:
+                self._write(data, timeout)
+
+    def _publish_tx_stats(self):
+        # publish the statistics about once per second
+        now = time.monotonic()
+        if now - self._tx_stats_time >= 1.0:
+            self._tx_stats_time = now
+            self.state["tx_coalesced"] = self.coalesced
+            self.state["tx_dropped"] = self.dropped
+
+    def _run_writer_thread(self):
+        while self._writer_running:
+            with self._pending_condition:
+                self._pending_condition.wait_for(lambda: self._pending or not self._writer_running, timeout=0.5)
+
+            # send all pending packets with a single write
+            self._flush()
+            self._publish_tx_stats()
+
+    def use_event_loop(self, loop: asyncio.AbstractEventLoop):
+        """
+        Run the writer on the given event loop (see run_writer_async()). Must be called before start().
+        """
+        self._loop = loop
+        self._tx_event = None
+
+    async def run_writer_async(self):
+        self._tx_event = asyncio.Event()
+        self._tx_event.set()
+
+        while self._writer_running:
+            await self._tx_event.wait()
+            self._tx_event.clear()
+
+            # send all pending packets without blocking the event loop
+            with self._pending_condition:
+                data = self._take_pending()
+                generation = self._tx_taken
+            if data:
+                logging.debug(f"RPI -> STM: {data.hex(' ')}")
+                await aio.write_all(self._serial, data)
+
+            # wake up send_raw() calls waiting for their packet
+            with self._pending_condition:
+                self._tx_written = generation
+                self._pending_condition.notify_all()
+
+            self._publish_tx_stats()
+
+    def _on_event_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _send_through_writer(self, data: bytes, timeout: float):
+        # the writer task owns the port while it is running, so a direct write could interleave with a partial write of it
+        with self._pending_condition:
+            self._pending[("raw", next(self._unkeyed_ids))] = data
+            generation = self._tx_taken + 1
+
+        if self._tx_event is not None:
+            self._loop.call_soon_threadsafe(self._tx_event.set)
+
+        # the writer task cannot run while the event loop is blocked, so packets sent from the loop itself are not awaited
+        if self._on_event_loop():
+            return
+
+        with self._pending_condition:
+            if not self._pending_condition.wait_for(lambda: self._tx_written >= generation or not self._writer_running, timeout=timeout):
+                logging.warning("Timeout while waiting for the IPC writer")
+
+    def send_raw(self, data: bytes, timeout=1.0):
+        # only short messages are supported
+        if len(data) != 4:
+            raise ValueError(f"IPC Data must be 4 bytes long, got {len(data)}")
+
+        # with the asyncio runtime, the packet is handed over to the writer task
+        if self._loop is not None and self._writer_running:
+            self._send_through_writer(bytes(data), timeout)
+            return
+
+        # send the packet. Any pending packets are sent first to preserve the order
+        with self._write_lock:
+            self._write(self._take_pending() + bytes(data), timeout)
+
+    def send(self, data: bytes, key=None):
+        """
+        Queue a packet for the writer thread without blocking. If a key is given, a pending packet with the same key is
+        replaced (e. g. to coalesce brightness updates of the same laser). Unkeyed packets are dropped if the queue is full.
+        """
+        if len(data) != 4:
+            raise ValueError(f"IPC Data must be 4 bytes long, got {len(data)}")
+
+        # send synchronously if the writer thread is not running
+        if not self._writer_running:
+            self.send_raw(data)
+            return
+
+        with self._pending_condition:
+            if key is None:
+                if self._pending_unkeyed >= self._write_queue_size:
+                    self.dropped += 1
+                    return
+
+                key = ("unkeyed", next(self._unkeyed_ids))
+                self._pending_unkeyed += 1
+            elif key in self._pending:
+                # move the packet to the end, so it is sent after any packet that was queued in the meantime
+                del self._pending[key]
+                self.coalesced += 1
+
+            self._pending[key] = bytes(data)
+            self._pending_condition.notify()
+
+        # wake up the writer task
+        if self._loop is not None and self._tx_event is not None:
+            self._loop.call_soon_threadsafe(self._tx_event.set)
+
+    def _receive(self, data: bytes):
+        for byte in data:
+            if byte & 0x80:
+                # a status byte always starts a new packet. Discard any incomplete packet
+                self.rx_dropped += len(self._rx_partial)
+                self._rx_partial.clear()
+            elif not self._rx_partial:
+                # data byte without a preceding status byte
+                self.rx_dropped += 1
+                continue
+
+            self._rx_partial.append(byte)
+
+            if len(self._rx_partial) == 4:
+                if len(self._rx_packets) >= self._rx_queue_size:
+                    # discard the oldest packet
+                    self._rx_packets.popleft()
+                    self.rx_overflows += 1
+
+                self._rx_packets.append(bytes(self._rx_partial))
+                self._rx_partial.clear()
+
+        # publish the error counters if they changed
+        if self.rx_dropped != self.state["rx_dropped"] or self.rx_overflows != self.state["rx_overflows"]:
+            self.state["rx_dropped"] = self.rx_dropped
+            self.state["rx_overflows"] = self.rx_overflows
+
     def read_raw(self, timeout=1.0) -> bytes:
         if not self.enabled:
             time.sleep(timeout)
             return None
 
-        # read the cable number and code index
-        self._serial.timeout = timeout
-        try:
-            data0 = self._serial.read(1)
-        except KeyboardInterrupt:
-            return None
-        if len(data0) == 0:
-            return None
+        deadline = time.monotonic() + timeout
+
+        while not self._rx_packets:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            # read everything that is available with a single call. If nothing is available, wait for the next byte
+            self._serial.timeout = remaining
+            try:
+                data = self._serial.read(self._serial.in_waiting or 1)
+            except KeyboardInterrupt:
+                return None
+            if len(data) == 0:
+                return None
+
+            self._receive(data)
+
+        data = self._rx_packets.popleft()
+        logging.debug(f"STM -> RPI: {data.hex(' ')}")
+        return data
 
-        # read the remaining packet
-        self._serial.timeout = self.BYTE_TIMEOUT * 3
-        data1 = self._serial.read(3)
-        if len(data1) != 3:
-            raise ValueError("Read timeout")
+    async def read_raw_async(self) -> bytes:
+        """
+        Wait for the next packet without blocking the event loop.
+        """
+        while not self._rx_packets:
+            self._receive(await aio.read_available(self._serial))
 
-        data = data0 + data1
+        data = self._rx_packets.popleft()
         logging.debug(f"STM -> RPI: {data.hex(' ')}")
         return data
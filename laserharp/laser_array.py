@@ -56,13 +56,35 @@ class LaserArray(Component):
         # apply the translation table and send the message
         if self._translation_table is not None:
             index = self._translation_table[index]
-        self.ipc.send_raw(bytes([0x80, index, brightness, np.clip(int(fade_duration * 10), 0, 255)]))
+        self.ipc.send(bytes([0x80, index, brightness, np.clip(int(fade_duration * 10), 0, 255)]), key=(0x80, index))
 
     def set_all(self, brightness: int, fade_duration: float = 0.0):
         self._laser_state[:] = brightness
 
         # send a message to set all lasers at once
-        self.ipc.send_raw(bytes([0x81, brightness, np.clip(int(fade_duration * 10), 0, 255), 0x00]))
+        self.ipc.send(bytes([0x81, brightness, np.clip(int(fade_duration * 10), 0, 255), 0x00]), key=(0x81,))
+
+    def apply(self, brightness, fade_duration: float = 0.0):
+        """
+        Set the brightness of all lasers using as few packets as possible.
+        """
+        target = np.asarray(brightness, dtype=np.uint8)
+        if target.shape != self._laser_state.shape:
+            raise ValueError(f"Expected {len(self)} brightness values, got {target.shape}")
+
+        changed = np.count_nonzero(target != self._laser_state)
+        if changed == 0:
+            return
+
+        # use a single set all packet for the most common value if this saves packets
+        values, counts = np.unique(target, return_counts=True)
+        common = values[np.argmax(counts)]
+        if 1 + len(self) - np.max(counts) < changed:
+            self.set_all(int(common), fade_duration)
+
+        # set the remaining lasers individually
+        for i in np.flatnonzero(target != self._laser_state):
+            self.set(int(i), int(target[i]), fade_duration)
 
     def push_state(self):
         self._state_stack.append(self._laser_state.copy())
@@ -71,8 +93,7 @@ class LaserArray(Component):
         state = self._state_stack.pop()
 
         # update all lasers to this state
-        for i, brightness in enumerate(state):
-            self.set(i, brightness)
+        self.apply(state)
 
     def play_animation(self, animation: str, duration: float = 1.0, follow_action: str = "loop", *, blocking=False):
         animation_id = self.ANIMATIONS.index(animation)
@@ -85,10 +106,10 @@ class LaserArray(Component):
         if follow_action_id == -1:
             raise ValueError(f"Unknown follow action: {follow_action}")
 
-        self.ipc.send_raw(bytes([0x83, animation_id, duration_byte, follow_action_id]))
+        self.ipc.send(bytes([0x83, animation_id, duration_byte, follow_action_id]))
 
         if blocking:
             time.sleep(duration)
 
     def stop_animation(self):
-        self.ipc.send_raw(bytes([0x84, 0x00, 0x00, 0x00]))
+        self.ipc.send(bytes([0x84, 0x00, 0x00, 0x00]))
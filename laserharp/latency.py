@@ -0,0 +1,70 @@
+import time
+from typing import Optional
+import numpy as np
+
+
+# libcamera sensor timestamps are based on the boot time clock, so all other timestamps use the same clock
+CLOCK = getattr(time, "CLOCK_BOOTTIME", time.CLOCK_MONOTONIC)
+
+
+def now_ns() -> int:
+    return time.clock_gettime_ns(CLOCK)
+
+
+class LatencyTracer:
+    # latency of each stage relative to the end of the previous one. "total" spans from the sensor exposure to the midi write
+    STAGES = ["capture", "preprocess", "process", "orchestrate", "midi_write", "total"]
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self, window: int = 500):
+        # rolling window of per-frame stage latencies in milliseconds. NaN marks a missing value
+        self._latencies = np.full((window, len(self.STAGES)), np.nan, dtype=np.float64)
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._latencies.fill(np.nan)
+        self._index = 0
+        self._count = 0
+
+    def record(self, sensor_ns: int, capture_ns: int, preprocess_ns: int, process_ns: int, orchestrate_ns: int, write_ns: Optional[int] = None):
+        """
+        Record the timestamps of a single frame. write_ns is None if no midi data was sent for this frame.
+        """
+        row = self._latencies[self._index]
+        row[0] = (capture_ns - sensor_ns) * 1e-6
+        row[1] = (preprocess_ns - capture_ns) * 1e-6
+        row[2] = (process_ns - preprocess_ns) * 1e-6
+        row[3] = (orchestrate_ns - process_ns) * 1e-6
+
+        if write_ns is not None:
+            row[4] = (write_ns - orchestrate_ns) * 1e-6
+            row[5] = (write_ns - sensor_ns) * 1e-6
+        else:
+            row[4] = np.nan
+            row[5] = np.nan
+
+        self._index = (self._index + 1) % len(self._latencies)
+        self._count = min(self._count + 1, len(self._latencies))
+
+    def summary(self) -> dict:
+        """
+        Calculate the latency percentiles of each stage in milliseconds.
+        """
+        latencies = self._latencies[: self._count]
+        result = {}
+
+        for i, stage in enumerate(self.STAGES):
+            values = latencies[:, i]
+            values = values[np.isfinite(values)]
+
+            if len(values) == 0:
+                result[stage] = {f"p{p}": None for p in self.PERCENTILES}
+            else:
+                percentiles = np.percentile(values, self.PERCENTILES)
+                result[stage] = {f"p{p}": float(v) for p, v in zip(self.PERCENTILES, percentiles)}
+
+        return result
@@ -0,0 +1,162 @@
+from .din_midi import DinMidi
+
+
+class MidiScheduler:
+    """
+    Collects the MIDI messages of one frame and sends as many of them as fit into a fixed byte budget. Note ons are served
+    first, then note offs and finally pitch bends. Messages that do not fit are deferred to the next frame.
+    """
+
+    NOTE_ON = 0x90
+    CONTROL_CHANGE = 0xB0
+    PITCHWHEEL = 0xE0
+
+    ALL_SOUND_OFF = 120
+    ALL_NOTES_OFF = 123
+
+    def __init__(self, din_midi: DinMidi, budget: int):
+        self._din_midi = din_midi
+        self.budget = budget
+
+        # pending messages. Dicts preserve the insertion order, so older messages are served first
+        self._note_ons = {}  # (channel, note) -> (velocity, retrigger)
+        self._note_offs = {}  # (channel, note) -> None
+        self._pitchwheels = {}  # channel -> pitch
+
+        # notes that were sent to the wire and not released yet
+        self._sounding = set()  # (channel, note)
+
+        # statistics
+        self.sent = 0  # number of messages sent
+        self.deferred = 0  # number of times a message did not fit into the budget and was delayed by a frame
+        self.coalesced = 0  # number of pitch bends that were replaced by a newer value before being sent
+        self.dropped = 0  # number of note ons that were cancelled by their note off before being sent
+
+    @property
+    def pending(self) -> int:
+        return len(self._note_ons) + len(self._note_offs) + len(self._pitchwheels)
+
+    @property
+    def sounding(self) -> set:
+        return set(self._sounding)
+
+    def clear(self):
+        self._note_ons.clear()
+        self._note_offs.clear()
+        self._pitchwheels.clear()
+
+    def release_all(self):
+        """
+        Discard all pending messages and immediately release every sounding note, regardless of the budget.
+        """
+        self.clear()
+
+        for channel, note in sorted(self._sounding):
+            self._din_midi.write(self.NOTE_ON | channel, note, 0)
+            self.sent += 1
+        self._sounding.clear()
+
+        self._din_midi.flush()
+
+    def panic(self, channel: int = 0):
+        """
+        Discard all pending messages and immediately silence the receiver using the all sound off and all notes off
+        controllers. Unlike release_all(), this also works if the sounding notes are unknown (e. g. after a restart).
+        """
+        self.clear()
+
+        self._din_midi.write(self.CONTROL_CHANGE | channel, self.ALL_SOUND_OFF, 0)
+        self._din_midi.write(self.CONTROL_CHANGE | channel, self.ALL_NOTES_OFF, 0)
+        self.sent += 2
+        self._sounding = {key for key in self._sounding if key[0] != channel}
+
+        self._din_midi.flush()
+
+    def note_on(self, channel: int, note: int, velocity: int):
+        if velocity == 0:
+            self.note_off(channel, note)
+            return
+
+        key = (channel, note)
+
+        # if the note is still waiting to be released, release it right before the new note on
+        _, retrigger = self._note_ons.get(key, (0, False))
+        if key in self._note_offs:
+            del self._note_offs[key]
+            retrigger = True
+
+        self._note_ons[key] = (velocity, retrigger)
+
+    def note_off(self, channel: int, note: int):
+        key = (channel, note)
+
+        pending = self._note_ons.pop(key, None)
+        if pending is not None:
+            self.dropped += 1
+
+            # the note never reached the wire. If it was a retrigger, the previous note still has to be released
+            _, retrigger = pending
+            if not retrigger:
+                return
+
+        self._note_offs[key] = None
+
+    def pitchwheel(self, channel: int, pitch: int):
+        if channel in self._pitchwheels:
+            self.coalesced += 1
+
+        self._pitchwheels[channel] = pitch
+
+    def flush(self):
+        budget = self.budget
+        running_status = None
+
+        def fits(status: int, size: int) -> bool:
+            nonlocal budget, running_status
+
+            size += status != running_status
+            if size > budget:
+                return False
+
+            budget -= size
+            running_status = status
+            return True
+
+        # note ons (a retrigger additionally needs to send the note off before)
+        for key, (velocity, retrigger) in list(self._note_ons.items()):
+            channel, note = key
+            if not fits(self.NOTE_ON | channel, 4 if retrigger else 2):
+                continue
+
+            if retrigger:
+                self._din_midi.write(self.NOTE_ON | channel, note, 0)
+                self.sent += 1
+            self._din_midi.write(self.NOTE_ON | channel, note, velocity)
+            self.sent += 1
+            self._sounding.add(key)
+            del self._note_ons[key]
+
+        # note offs (sent as note on with velocity 0)
+        for key in list(self._note_offs):
+            channel, note = key
+            if not fits(self.NOTE_ON | channel, 2):
+                continue
+
+            self._din_midi.write(self.NOTE_ON | channel, note, 0)
+            self.sent += 1
+            self._sounding.discard(key)
+            del self._note_offs[key]
+
+        # pitch bends
+        for channel, pitch in list(self._pitchwheels.items()):
+            if not fits(self.PITCHWHEEL | channel, 2):
+                continue
+
+            value = pitch + 8192
+            self._din_midi.write(self.PITCHWHEEL | channel, value & 0x7F, value >> 7)
+            self.sent += 1
+            del self._pitchwheels[channel]
+
+        self.deferred += self.pending
+
+        self._din_midi.flush()
@@ -1,12 +1,17 @@
 import logging
+import time
+import threading
 from typing import Any, Optional
 import numpy as np
 from perci import ReactiveDictNode, watch
 from .component import Component
 from .midi import MidiEvent
+from .events import SPSCQueue
+from .latency import now_ns
 from .image_processor import ImageProcessor
 from .laser_array import LaserArray
 from .din_midi import DinMidi
+from .midi_scheduler import MidiScheduler
 from .scales import calculate_pedal_positions
 
 
@@ -20,17 +25,43 @@ class Orchestrator(Component):
         self._laser_array = laser_array
         self._din_midi = din_midi
 
+        # limit the number of bytes sent per frame, so note ons are never delayed by a backlog of other messages
+        self._midi_scheduler = MidiScheduler(self._din_midi, self._din_midi.config.get("frame_budget", 60))
+        self._midi_scheduler_stats = None
+
+        # incoming midi events are queued by the reader thread and applied at the start of each frame
+        self._midi_input_queue = SPSCQueue(self.config.get("midi_input_queue_size", 64))
+        self._midi_input_stats = self._reset_midi_input_stats()
+        self._midi_input_stats_time = 0.0
+
+        # setting changes may arrive on any thread. They are recorded here and applied at the start of the next frame
+        self._control_lock = threading.Lock()
+        self._pending_flip = False
+        self._pending_brightness_fade = None  # fade duration of a pending brightness update
+
+        # time (in ns) at which the last call to process() was done, not including the midi output
+        self.process_time = None
+
         # setup an array of shape (num_sections, num_lasers) to keep track of which lasers are active
         self.state["active"] = [[False] * len(self._laser_array)]
 
         self._intersections = np.inf * np.ones(len(self._laser_array), dtype=float)
         self._emulated_intersections = np.inf * np.ones(len(self._laser_array), dtype=float)
+        self._requested_brightness = np.zeros(len(self._laser_array), dtype=np.uint8)  # brightness set via the brightness channel
         self._previous_velocities = np.zeros(128, dtype=np.uint8)
         self._previous_pitch_bend = 0
 
+        # precompute the lookup tables for every combination of key, mode, octave and flip
+        self._precompute_lookup_tables()
+        self._lookup_index = None
+
         self._note_lookup_table = -1 * np.ones(len(self._laser_array), dtype=np.int8)  # map step -> note
         self._note_lookup_table_reverse = -1 * np.ones(128, dtype=np.int8)  # map note -> step
 
+        # compressed lookup table containing only the lasers that are mapped to a note
+        self._mapped_lookup = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))  # (laser indices, notes)
+        self._velocities = np.zeros(128, dtype=np.uint8)
+
         self._brightness_lookup_cache = -1 * np.ones(128, dtype=np.int8)
         self._emulated_lookup_cache = -1 * np.ones(128, dtype=np.int8)
 
@@ -38,33 +69,54 @@ class Orchestrator(Component):
         watch(self.settings.get_child("blackout_enabled"), lambda change: self._on_blackout_changed(change.value))
         watch(self.settings.get_child("unplucked_beam_brightness"), lambda change: self._on_unplucked_brightness_changed(change.value))
 
-    def _update_lookup_tables(self):
-        # reset tables
-        self._note_lookup_table.fill(-1)
-        self._note_lookup_table_reverse.fill(-1)
+    def _precompute_lookup_tables(self):
+        num_lasers = len(self._laser_array)
 
-        # generate scale table
-        indices = np.arange(7, dtype=np.int8)
-        scale_table = np.mod(self.MAJOR_SCALE[np.mod(indices + 7 - self.MAJOR_SCALE_INVERSE[self.settings["key"]].astype(np.int8), 7)] + self.settings["key"], 12)
-        assert len(scale_table) == 7
+        # generate the scale table of each key. Shape: (key, step)
+        keys = np.arange(12)[:, np.newaxis]
+        indices = np.arange(7)[np.newaxis, :]
+        scale_tables = np.mod(self.MAJOR_SCALE[np.mod(indices + 7 - self.MAJOR_SCALE_INVERSE[keys], 7)].astype(int) + keys, 12)
 
-        for i in range(len(self._laser_array)):
-            step = i + self.settings["mode"]
-            octave = step // len(scale_table)
-            step_within_octave = np.mod(step, len(scale_table))
-            note = (self.settings["octave"] + octave) * 12 + scale_table[step_within_octave]
-            # print(i, "->", note)
+        # calculate the note of each laser. Shape: (key, mode, octave, laser)
+        steps = np.arange(7)[:, np.newaxis] + np.arange(num_lasers)[np.newaxis, :]
+        octaves = np.arange(11)[:, np.newaxis]
+        notes = (octaves[np.newaxis, np.newaxis] + steps[np.newaxis, :, np.newaxis] // 7) * 12 + scale_tables[:, steps % 7][:, :, np.newaxis]
 
-            # skip if note is out of bounds
-            if not 0 < note <= 128:
-                continue
+        # skip notes that are out of bounds
+        notes = np.where((notes > 0) & (notes < 128), notes, -1).astype(np.int8)
 
-            # use either normal or flipped laser index
-            laser_index = len(self._laser_array) - i - 1 if self.settings["flipped"] else i
+        # use either normal or flipped laser index. Shape: (key, mode, octave, flipped, laser)
+        self._note_lookup_tables = np.stack([notes, notes[..., ::-1]], axis=3)
 
-            # store both forward and reverse lookup
-            self._note_lookup_table[laser_index] = note
-            self._note_lookup_table_reverse[note] = laser_index
+        # generate the reverse lookup. Shape: (key, mode, octave, flipped, note)
+        self._note_lookup_tables_reverse = -1 * np.ones(self._note_lookup_tables.shape[:-1] + (128,), dtype=np.int8)
+        forward = self._note_lookup_tables.reshape(-1, num_lasers)
+        reverse = self._note_lookup_tables_reverse.reshape(-1, 128)
+        combinations, laser_indices = np.nonzero(forward >= 0)
+        reverse[combinations, forward[combinations, laser_indices]] = laser_indices
+
+        # the selected tables are views, so make sure they are never modified
+        self._note_lookup_tables.flags.writeable = False
+        self._note_lookup_tables_reverse.flags.writeable = False
+
+        # store the mapped lasers and their notes for the vectorized note lookup
+        self._mapped_lookups = []
+        for table in forward:
+            mapped_lasers = np.flatnonzero(table >= 0)
+            self._mapped_lookups.append((mapped_lasers, table[mapped_lasers].astype(np.intp)))
+
+    def _update_lookup_tables(self):
+        # select the precomputed tables. Nothing to do if the settings did not change
+        index = (self.settings["key"], self.settings["mode"], self.settings["octave"], int(self.settings["flipped"]))
+        if index == self._lookup_index:
+            return
+        self._lookup_index = index
+
+        self._note_lookup_table = self._note_lookup_tables[index]
+        self._note_lookup_table_reverse = self._note_lookup_tables_reverse[index]
+
+        # replace the compressed lookup at once, as process() might run concurrently
+        self._mapped_lookup = self._mapped_lookups[np.ravel_multi_index(index, self._note_lookup_tables.shape[:-1])]
 
         # reset caches
         self._brightness_lookup_cache = -1 * np.ones(128, dtype=np.int8)
@@ -87,46 +139,108 @@ class Orchestrator(Component):
         return index
 
     def _on_flipped_changed(self, _: bool):
-        # play flip animation
-        self._laser_array.play_animation("flip", 0.5, "restore")
-
-        # regenerate lookup tables
-        self._update_lookup_tables()
-
-    def _on_blackout_changed(self, value: bool):
-        if value:
-            # turn off all lasers
-            self._laser_array.set_all(0, 1.0)
-        else:
-            # restore unplucked beam brightness
-            self._laser_array.set_all(self.settings["unplucked_beam_brightness"], 1.0)
-
-    def _on_unplucked_brightness_changed(self, value: int):
-        # set the unplucked beam brightness
-        if not self.settings["blackout_enabled"]:
-            # only update if blackout is not enabled
-            self._laser_array.set_all(value)
+        with self._control_lock:
+            self._pending_flip = True
+
+    def _apply_brightness(self, lower_ceiling: int, fade_duration: float = 0.0):
+        # lasers lit via the brightness channel keep their brightness, all others are set to the lower ceiling
+        self._laser_array.apply(np.maximum(self._requested_brightness, lower_ceiling), fade_duration)
+
+    def _on_blackout_changed(self, _: bool):
+        # fade the lasers in or out
+        with self._control_lock:
+            self._pending_brightness_fade = 1.0
+
+    def _on_unplucked_brightness_changed(self, _: int):
+        # set the unplucked beam brightness immediately, unless a fade is pending anyway
+        with self._control_lock:
+            if self._pending_brightness_fade is None:
+                self._pending_brightness_fade = 0.0
+
+    def apply_control_changes(self):
+        # nothing changed since the last frame
+        if not self._pending_flip and self._pending_brightness_fade is None:
+            return
+
+        with self._control_lock:
+            flip, self._pending_flip = self._pending_flip, False
+            fade_duration, self._pending_brightness_fade = self._pending_brightness_fade, None
+
+        if flip:
+            # play flip animation
+            self._laser_array.play_animation("flip", 0.5, "restore")
+
+            # regenerate lookup tables
+            self._update_lookup_tables()
+
+        if fade_duration is not None:
+            if self.settings["blackout_enabled"]:
+                # turn off all lasers. The requested brightness is kept, so it can be restored afterwards
+                self._laser_array.apply(np.zeros(len(self._laser_array), dtype=np.uint8), fade_duration)
+            else:
+                # restore unplucked beam brightness
+                self._apply_brightness(self.settings["unplucked_beam_brightness"], fade_duration)
 
     def start(self):
         # initialize the lookup tables
         self._update_lookup_tables()
 
         # light all lasers
-        self._laser_array.set_all(self.settings["unplucked_beam_brightness"], 1.0)
+        self._apply_brightness(self.settings["unplucked_beam_brightness"], 1.0)
 
-        # release all notes
-        for note in range(128):
-            self._din_midi.send(MidiEvent(0, "note_off", note=note))
+        # silence any notes left over from a previous run
+        self.panic()
 
     def stop(self):
-        # release all notes
-        for note in range(128):
-            self._din_midi.send(MidiEvent(0, "note_off", note=note))
+        # release all sounding notes
+        self._midi_scheduler.release_all()
+        self._previous_velocities.fill(0)
+
+    def panic(self):
+        # silence the receiver and forget about all sounding notes. Notes that are still plucked will be triggered again
+        self._midi_scheduler.panic(0)
+        self._previous_velocities.fill(0)
 
     def flip(self):
         self.settings["flipped"] = not self.settings["flipped"]
 
     def handle_midi_event(self, event: MidiEvent):
+        # queue the event. It will be applied by the processing thread at the next frame boundary
+        self._midi_input_queue.put((time.perf_counter(), event))
+
+    def apply_midi_events(self):
+        stats = self._midi_input_stats
+        stats["queue_depth"] = max(stats["queue_depth"], len(self._midi_input_queue))
+
+        while (item := self._midi_input_queue.get()) is not None:
+            timestamp, event = item
+            self._apply_midi_event(event)
+
+            # measure the time between receiving and applying the event
+            latency = time.perf_counter() - timestamp
+            stats["events"] += 1
+            stats["latency_sum"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+
+        # publish the metrics about once per second
+        now = time.perf_counter()
+        if now - self._midi_input_stats_time < 1.0:
+            return
+        self._midi_input_stats_time = now
+
+        self.state["midi_input"] = {
+            "queue_depth": stats["queue_depth"],
+            "overflows": self._midi_input_queue.overflows,
+            "latency_mean": stats["latency_sum"] / stats["events"] if stats["events"] > 0 else 0.0,
+            "latency_max": stats["latency_max"],
+        }
+        self._midi_input_stats = self._reset_midi_input_stats()
+
+    @staticmethod
+    def _reset_midi_input_stats():
+        return {"queue_depth": 0, "events": 0, "latency_sum": 0.0, "latency_max": 0.0}
+
+    def _apply_midi_event(self, event: MidiEvent):
         match event.message.type:
             case "note_on" | "note_off":
                 note = event.message.note
@@ -138,6 +252,8 @@ class Orchestrator(Component):
                         if index == -1:
                             return
 
+                        self._requested_brightness[index] = velocity
+
                         lower_ceiling = 0 if self.settings["blackout_enabled"] else self.settings["unplucked_beam_brightness"]
                         brightness = np.clip(velocity, lower_ceiling, 127)
                         self._laser_array.set(index, brightness)
@@ -184,7 +300,8 @@ class Orchestrator(Component):
                             self.settings["octave"] = 4
                             self.settings["mode"] = 0
 
-                            # TODO: reset caches, previous velocity and send panic (all notes off)
+                            # send panic (all notes off). The caches are reset when updating the lookup tables below
+                            self.panic()
 
                         self._update_lookup_tables()
 
@@ -198,6 +315,10 @@ class Orchestrator(Component):
                 return
 
     def process(self, intersections: ImageProcessor.Result, dt: float):
+        # apply all midi events and setting changes that arrived since the last frame
+        self.apply_midi_events()
+        self.apply_control_changes()
+
         # store intersection lengths. Use np.inf for inactive beams
         self._intersections = np.where(intersections.active, intersections.length, np.inf)
 
@@ -205,39 +326,27 @@ class Orchestrator(Component):
         emulated_intersections_active = np.isfinite(self._emulated_intersections)
         self._intersections[emulated_intersections_active] = self._emulated_intersections[emulated_intersections_active]
 
-        # calculate new velocities and average modulation
-        velocities = np.zeros(128, dtype=np.uint8)
-        modulationSum = 0
-        modulationContributors = 0
-
-        for i in range(len(self._laser_array)):
-            # convert laser index to note number
-            note = self._note_lookup_table[i]
-            if note == -1:
-                continue
+        # gather the plucked state of all lasers that are mapped to a note
+        mapped_lasers, mapped_notes = self._mapped_lookup
+        plucked = ~np.isinf(self._intersections[mapped_lasers])
 
-            # set the note
-            if not np.isinf(self._intersections[i]):
-                velocities[note] = 127
-
-                modulationSum += intersections.modulation[i]
-                modulationContributors += 1
+        # calculate new velocities and average modulation
+        velocities = self._velocities
+        velocities.fill(0)
+        velocities[mapped_notes[plucked]] = 127
 
-        # compare with previous state to generate note on/off events
-        for note in range(128):
-            previous_velocity = self._previous_velocities[note]
-            velocity = velocities[note]
+        modulationSum = np.sum(intersections.modulation[mapped_lasers[plucked]])
+        modulationContributors = np.count_nonzero(plucked)
 
-            # send note off
-            if velocity == 0 and previous_velocity > 0:
-                self._din_midi.send(MidiEvent(0, "note_off", note=note))
+        # compare with previous state to generate note on/off events only for the notes that changed
+        for note in np.flatnonzero(velocities != self._previous_velocities):
+            velocity = int(velocities[note])
 
-            # send note on
-            if velocity > 0 and previous_velocity == 0:
-                self._din_midi.send(MidiEvent(0, "note_on", note=note, velocity=velocity))
+            # queue note on or note off
+            self._midi_scheduler.note_on(0, int(note), velocity)
 
         # store previous velocities
-        self._previous_velocities = velocities
+        self._previous_velocities, self._velocities = velocities, self._previous_velocities
 
         # calculate pitch bend
         if modulationContributors > 0:
@@ -250,5 +359,19 @@ class Orchestrator(Component):
             pitch_bend = 0
 
         if pitch_bend != self._previous_pitch_bend:
-            self._din_midi.send(MidiEvent(0, "pitchwheel", pitch=pitch_bend))
+            self._midi_scheduler.pitchwheel(0, pitch_bend)
             self._previous_pitch_bend = pitch_bend
+
+        # send all messages of this frame that fit into the budget
+        self.process_time = now_ns()
+        self._midi_scheduler.flush()
+
+        # publish the scheduler statistics. They only change under congestion
+        stats = (self._midi_scheduler.deferred, self._midi_scheduler.coalesced, self._midi_scheduler.dropped)
+        if stats != self._midi_scheduler_stats:
+            self._midi_scheduler_stats = stats
+            self.state["midi_scheduler"] = {
+                "deferred": stats[0],
+                "coalesced": stats[1],
+                "dropped": stats[2],
+            }
@@ -1,47 +1,8 @@
-import time
-import threading
-from dataclasses import asdict
 from flask import Flask, Response, stream_with_context, request
 from flask_cors import CORS
 from flask_socketio import SocketIO
-import cv2
-from perci import QueueWatcher, create_queue_watcher
-from perci.changes import Change
 from laserharp.app import LaserHarpApp
-
-
-class Session:
-    def __init__(self, socketio: SocketIO, clientid: str, laserharp: LaserHarpApp):
-        self.socketio = socketio
-        self.clientid = clientid
-        self.laserharp = laserharp
-
-        # send the initial state
-        self.socketio.emit("app:global_state:init", laserharp.get_global_state().json())
-
-        # create a new queue watcher
-        self.watcher = create_queue_watcher(laserharp.get_global_state())
-
-        # create a thread that watches for changes
-        self.running = False
-        self.thread = threading.Thread(target=self._run)
-
-    def start(self):
-        self.running = True
-        self.thread.start()
-
-    def stop(self):
-        self.laserharp.get_global_state().get_namespace().remove_watcher(self.watcher)
-        self.running = False
-
-    def _run(self):
-        while self.running:
-            changes = [asdict(change) for change in self.watcher.get_changes()]
-
-            if changes:
-                self.socketio.emit("app:global_state:changes", changes, to=self.clientid)
-
-            time.sleep(1 / 30)
+from .broadcaster import StateBroadcaster
 
 
 def create_backend(laserharp: LaserHarpApp) -> tuple[Flask, callable]:
@@ -49,26 +10,37 @@ def create_backend(laserharp: LaserHarpApp) -> tuple[Flask, callable]:
     socketio = SocketIO(app, cors_allowed_origins="*", path="/ws")
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-    sessions: dict[str, Session] = {}
+    # a single broadcaster serves the state changes to all clients
+    broadcaster = StateBroadcaster(socketio, laserharp.get_global_state())
+    broadcaster.start()
 
     @socketio.on("connect")
     def on_connect():
         clientid = request.sid
         print(f"Client connected: {clientid}")
 
-        # create a new session
-        session = Session(socketio, clientid, laserharp)
-        session.start()
-        sessions[clientid] = session
+        # send the initial state and subscribe to changes
+        broadcaster.add_client(clientid)
 
     @socketio.on("disconnect")
     def on_disconnect():
         clientid = request.sid
         print(f"Client disconnected: {clientid}")
 
-        # remove and stop the session
-        session = sessions.pop(clientid)
-        session.stop()
+        broadcaster.remove_client(clientid)
+
+    @socketio.on("app:global_state:subscribe")
+    def on_subscribe(data):
+        try:
+            return {
+                "status": "ok",
+                **broadcaster.subscribe(request.sid, (data or {}).get("encoding", "json")),
+            }
+        except ValueError as e:
+            return {
+                "status": "error",
+                "error": str(e),
+            }
 
     @socketio.on_error()
     def on_error(e):
@@ -93,40 +65,48 @@ def create_backend(laserharp: LaserHarpApp) -> tuple[Flask, callable]:
     def on_calibrate(_data):
         laserharp.run_calibration()
 
+    @socketio.on("app:calibration:rollback")
+    def on_calibration_rollback(data):
+        # restore a stored calibration by its id or the previous one
+        laserharp.rollback_calibration((data or {}).get("id"))
+
+    @app.route("/api/latency")
+    def latency():
+        # per-stage latency percentiles in milliseconds
+        return laserharp.latency_tracer.summary()
+
     @app.route("/api/stream.mjpg")
     def stream():
-        print("START STREAMING")
         if not laserharp.camera.enabled:
             return Response("Camera is not enabled", status=503)
 
-        # output = laserharp.get_debug_stream_output()
+        encoder = laserharp.get_stream_encoder()
 
         @stream_with_context
         def generate():
-            while True:
-                # with output.condition:
-                #     output.condition.wait()
-
-                #     frame = output.frame
-                #     if frame is None:
-                #         continue
-
-                #     yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n\r\n")
-
-                # wait for the next frame and convert it to JPEG
-                frame = laserharp.camera.wait_for_frame_or_black()
-                ret, jpeg = cv2.imencode('.jpg', frame)
-                if not ret:
-                    continue
-
-                # yield the result as a multipart response
-                byte_frame = jpeg.tobytes()
-                yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + byte_frame + b"\r\n\r\n")
+            # all clients share the frames of a single encoder
+            encoder.open()
+
+            try:
+                sequence = 0
+                while True:
+                    # wait for the next frame. Frames that were encoded while the client was busy are skipped
+                    sequence, jpeg = encoder.wait_for_jpeg(sequence)
+                    if jpeg is None:
+                        continue
+
+                    # yield the result as a multipart response
+                    yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n\r\n")
+            finally:
+                encoder.close()
 
         return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
     def run(*kargs, **kwargs):
         # run the app with the socketio wrapper
-        socketio.run(app, *kargs, **kwargs)
+        try:
+            socketio.run(app, *kargs, **kwargs)
+        finally:
+            broadcaster.stop()
 
     return app, run
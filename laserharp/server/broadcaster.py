@@ -0,0 +1,245 @@
+import time
+import struct
+import threading
+from dataclasses import asdict
+from typing import Any, Optional
+import numpy as np
+from perci import ReactiveDictNode, create_queue_watcher
+
+
+def coalesce_changes(changes: list) -> list:
+    """
+    Reduce each run of consecutive updates to the last update of each path. The updates of a run keep the order of their
+    last occurrence, so applying them yields the same state as applying the whole list. Structural changes (add and
+    remove) may shift list indices, so they are kept in order and start a new run.
+    """
+    coalesced = []
+    run = {}
+
+    for change in changes:
+        if change.change_type != "update":
+            coalesced.extend(run.values())
+            coalesced.append(change)
+            run = {}
+            continue
+
+        # move the path to the end, so it is applied after all changes that happened before it
+        key = tuple(change.path)
+        run.pop(key, None)
+        run[key] = change
+
+    coalesced.extend(run.values())
+    return coalesced
+
+
+class ArrayChannel:
+    """
+    Mirrors a dict of equally long lists in the global state and encodes it into a fixed binary layout: the number of
+    elements as uint32, followed by each field as a packed array. All values are little endian, float fields come first so
+    they stay 4 byte aligned.
+    """
+
+    def __init__(self, path: tuple, fields: dict[str, np.dtype]):
+        self.path = tuple(path)
+        self.fields = {key: np.dtype(dtype) for key, dtype in fields.items()}
+        self._arrays = {key: np.zeros(0, dtype=dtype) for key, dtype in self.fields.items()}
+        self.dirty = False
+
+    @property
+    def layout(self) -> list:
+        return [[key, dtype.name] for key, dtype in self.fields.items()]
+
+    def contains(self, change) -> bool:
+        # changes within the channel
+        return tuple(change.path[: len(self.path)]) == self.path
+
+    def affects(self, change) -> bool:
+        # changes within the channel or structural changes of one of its parents
+        n = min(len(change.path), len(self.path))
+        return tuple(change.path[:n]) == self.path[:n]
+
+    def apply(self, change, global_state: ReactiveDictNode):
+        path = tuple(change.path)
+
+        # single value updates are applied directly
+        if change.change_type == "update" and len(path) == len(self.path) + 2 and path[: len(self.path)] == self.path:
+            key, index = path[-2], int(path[-1])
+            array = self._arrays.get(key)
+            if array is not None and index < len(array):
+                array[index] = change.value
+                self.dirty = True
+                return
+
+        # everything else changes the structure, so read the whole channel again
+        self.reset(global_state)
+
+    def reset(self, global_state: ReactiveDictNode):
+        value = _lookup(global_state, self.path)
+        for key, dtype in self.fields.items():
+            values = value.get(key) if isinstance(value, dict) else None
+            self._arrays[key] = np.array(values if values is not None else [], dtype=dtype)
+
+        self.dirty = True
+
+    def encode(self) -> bytes:
+        count = min(len(array) for array in self._arrays.values())
+        return struct.pack("<I", count) + b"".join(array[:count].astype(dtype.newbyteorder("<"), copy=False).tobytes() for array, dtype in zip(self._arrays.values(), self.fields.values()))
+
+
+def _lookup(global_state: ReactiveDictNode, path: tuple) -> Optional[Any]:
+    node = global_state
+    try:
+        for key in path[1:]:
+            node = node[key]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+    return node.json() if hasattr(node, "json") else node
+
+
+class StateBroadcaster:
+    """
+    Sends global state changes to all connected web clients. A single watcher is drained at a fixed rate, its changes are
+    coalesced and serialized once per tick, and the same payload is emitted to a room that all clients join. Clients can
+    subscribe to the binary encoding, which replaces the per-beam result changes with a single typed array packet.
+    """
+
+    ROOM = "global_state"
+    BINARY_ROOM = "global_state:binary"
+    ENCODINGS = ("json", "binary")
+
+    def __init__(self, socketio, global_state: ReactiveDictNode, rate: float = 30):
+        self._socketio = socketio
+        self._global_state = global_state
+        self._interval = 1 / rate
+
+        self._clients = {}  # clientid -> encoding
+        self._watcher = None
+
+        # high rate per-beam results are sent as typed arrays to clients that subscribed to the binary encoding
+        self.result_channel = ArrayChannel(
+            ("root", "image_processor", "state", "result"),
+            {"length": np.float32, "modulation": np.float32, "active": np.uint8},
+        )
+
+        # makes sure a new client receives either a change or the state that already contains it, never both orders
+        self._lock = threading.Lock()
+
+        # statistics
+        self.ticks = 0
+        self.changes_received = 0
+        self.changes_sent = 0
+
+        self._running = False
+        self._thread = None
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+        with self._lock:
+            self._remove_watcher()
+            self._clients.clear()
+
+    def add_client(self, clientid: str):
+        with self._lock:
+            # only watch the state while someone is listening
+            if self._watcher is None:
+                self._watcher = create_queue_watcher(self._global_state)
+                self.result_channel.reset(self._global_state)
+
+            self._socketio.emit("app:global_state:init", self._global_state.json(), to=clientid)
+            self._socketio.server.enter_room(clientid, self.ROOM, namespace="/")
+            self._clients[clientid] = "json"
+
+    def subscribe(self, clientid: str, encoding: str) -> dict:
+        """
+        Select the encoding of the changes sent to a client. Returns the binary layout of the result channel.
+        """
+        if encoding not in self.ENCODINGS:
+            raise ValueError(f"Unsupported encoding '{encoding}'")
+
+        with self._lock:
+            if clientid not in self._clients:
+                raise ValueError(f"Client '{clientid}' is not connected")
+
+            previous = self._clients[clientid]
+            if previous != encoding:
+                self._socketio.server.leave_room(clientid, self._room(previous), namespace="/")
+                self._socketio.server.enter_room(clientid, self._room(encoding), namespace="/")
+                self._clients[clientid] = encoding
+
+        return {"encoding": encoding, "layout": self.result_channel.layout}
+
+    def _room(self, encoding: str) -> str:
+        return self.BINARY_ROOM if encoding == "binary" else self.ROOM
+
+    def remove_client(self, clientid: str):
+        with self._lock:
+            self._clients.pop(clientid, None)
+
+            if not self._clients:
+                self._remove_watcher()
+
+    def _remove_watcher(self):
+        if self._watcher is not None:
+            self._global_state.get_namespace().remove_watcher(self._watcher)
+            self._watcher = None
+
+    def tick(self):
+        with self._lock:
+            if self._watcher is None:
+                return
+
+            changes = self._watcher.get_changes()
+            if not changes:
+                return
+
+            self.ticks += 1
+            self.changes_received += len(changes)
+            changes = coalesce_changes(changes)
+
+            # keep the binary result channel up to date. Binary clients receive all other changes as usual
+            other_changes = []
+            for change in changes:
+                if self.result_channel.affects(change):
+                    self.result_channel.apply(change, self._global_state)
+                if not self.result_channel.contains(change):
+                    other_changes.append(change)
+
+            encodings = set(self._clients.values())
+
+            # serialize once for all clients of each encoding
+            if "json" in encodings:
+                payload = [asdict(change) for change in changes]
+                self.changes_sent += len(payload)
+                self._socketio.emit("app:global_state:changes", payload, to=self.ROOM)
+
+            if "binary" in encodings:
+                if other_changes:
+                    payload = [asdict(change) for change in other_changes]
+                    self.changes_sent += len(payload)
+                    self._socketio.emit("app:global_state:changes", payload, to=self.BINARY_ROOM)
+
+                if self.result_channel.dirty:
+                    self._socketio.emit("app:global_state:result", self.result_channel.encode(), to=self.BINARY_ROOM)
+
+            self.result_channel.dirty = False
+
+    def _run(self):
+        while self._running:
+            t0 = time.monotonic()
+            self.tick()
+
+            time.sleep(max(0.0, self._interval - (time.monotonic() - t0)))
@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any, TypeVar, Generic, Optional, Union
 from dataclasses import asdict
@@ -156,16 +157,27 @@ class SettingsManager:
         "bool": BoolSetting,
     }
 
-    def __init__(self, global_state: ReactiveDictNode):
+    def __init__(self, global_state: ReactiveDictNode, store: Optional[Store] = None):
         self._global_state = global_state
         self._settings = {}
 
-        self._store = Store()
+        self._store = store or Store()
+
+        # raw values as they are currently stored. Used to skip writes of unchanged values
+        self._stored = {}
+        self.restore_stats = None
 
         self._running = False
         self._thread = threading.Thread(target=self._run_store_thread)
 
     def setup(self):
+        start = time.perf_counter()
+
+        # load the whole settings table at once and validate the values from memory
+        self._stored = self._store.fetch_settings()
+        fetched = time.perf_counter()
+        restored = 0
+
         for component in self._global_state.keys():
             if "settings" not in self._global_state[component]["config"]:
                 self._global_state[component]["config"]["settings"] = {}
@@ -195,57 +207,91 @@ class SettingsManager:
                 setting_class = self.SETTING_CLASSES[setting_type]
                 self._settings[component + "." + key] = setting_class(key, target, desc)
 
-                # fetch the initial value from the store
-                self._fetch_store(component, key)
+                # restore the initial value from the store
+                restored += self._restore(component, key)
+
+        end = time.perf_counter()
+        self.restore_stats = {
+            "settings": len(self._settings),
+            "restored": restored,
+            "fetch_time": fetched - start,
+            "total_time": end - start,
+        }
+        logging.info(f"Restored {restored} of {len(self._settings)} settings in {(end - start) * 1e3:.1f} ms (fetch {(fetched - start) * 1e3:.1f} ms)")
 
         # add a watcher to the global state
         self._watcher = create_queue_watcher(self._global_state)
 
-    def start(self):
+    def start(self, run_thread: bool = True):
         self._running = True
-        self._thread.start()
+
+        # without the thread, run_async() has to be scheduled on an event loop
+        if run_thread:
+            self._thread.start()
 
     def stop(self):
-        self._global_state.get_namespace().remove_watcher(self._watcher)
         self._running = False
+        if self._thread.is_alive():
+            self._thread.join()
+
+        # store the remaining changes, so nothing is lost on shutdown
+        self._store_changes()
+        self._global_state.get_namespace().remove_watcher(self._watcher)
 
     def _run_store_thread(self):
         while self._running:
-            changes = self._watcher.get_changes()
-            changed_settings = {}
-
-            # gather all changed settings
-            for change in changes:
-                if change.change_type != "update":
-                    continue
-
-                # path should match root.<component>.settings.<key>
-                if len(change.path) != 4:
-                    continue
-
-                if change.path[0] != "root" or change.path[2] != "settings":
-                    continue
-
-                component = change.path[1]
-                key = change.path[3]
-                changed_settings[component + "." + key] = change.value
-
-            # store all changed settings
-            for setting_key, value in changed_settings.items():
-                self._store.update_setting(setting_key, str(value))
-
+            self._store_changes()
             time.sleep(1)
 
-    def _fetch_store(self, component: str, key: str):
-        value = self._store.fetch_setting(component + "." + key)
+    async def run_async(self):
+        while self._running:
+            self._store_changes()
+            await asyncio.sleep(1)
+
+    def _store_changes(self):
+        changes = self._watcher.get_changes()
+        changed_settings = {}
+
+        # gather all changed settings
+        for change in changes:
+            if change.change_type != "update":
+                continue
+
+            # path should match root.<component>.settings.<key>
+            if len(change.path) != 4:
+                continue
+
+            if change.path[0] != "root" or change.path[2] != "settings":
+                continue
+
+            component = change.path[1]
+            key = change.path[3]
+            changed_settings[component + "." + key] = change.value
+
+        # store all settings whose value actually changed in a single transaction
+        updates = {}
+        for setting_key in changed_settings:
+            value = str(self._settings[setting_key]) if setting_key in self._settings else str(changed_settings[setting_key])
+            if self._stored.get(setting_key) != value:
+                updates[setting_key] = value
+
+        if updates:
+            self._store.update_settings(updates)
+            self._stored.update(updates)
+
+    def _restore(self, component: str, key: str) -> bool:
+        value = self._stored.get(component + "." + key)
         if value is None:
-            return
+            return False
 
         try:
             logging.debug(f"Setting initial value '{value}' for setting '{component}.{key}'")
             self.get(component, key).set_value(value)
         except ValueError:
             logging.error(f"Failed to set initial value '{value}' for setting '{component}.{key}'")
+            return False
+
+        return True
 
     def has(self, component: str, key: str) -> bool:
         return component + "." + key in self._settings
@@ -26,12 +26,19 @@ class Store:
         db_empty = not os.path.exists(self._db_file)
         self._db_conn = sqlite3.connect(self._db_file, check_same_thread=False)
 
+        # use write-ahead logging. With synchronous=NORMAL, commits do not wait for an fsync, which avoids stalls on SD cards
+        self._db_conn.execute("PRAGMA journal_mode=WAL")
+        self._db_conn.execute("PRAGMA synchronous=NORMAL")
+
         # initialize the database
         if db_empty:
             logging.debug("Initializing new database")
             self._db_conn.execute(DB_SCHEMA)
             self._db_conn.commit()
 
+    def close(self):
+        self._db_conn.close()
+
     def fetch_settings(self) -> dict[str, str]:
         """
         Fetch all settings.
@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+import threading
+from typing import Optional
+import cv2
+from .camera import Camera
+
+
+class StreamEncoder:
+    """
+    Encodes the camera debug view to JPEG on a single background thread that is shared by all stream clients. The thread
+    only runs while at least one client is connected and is capped to a maximum frame rate. Clients always get the most
+    recent frame, so slow clients skip frames instead of queueing them.
+    """
+
+    def __init__(self, camera: Camera, resolution: tuple[int, int], framerate: float = 15, quality: int = 70):
+        self._camera = camera
+        self.resolution = tuple(resolution)
+        self.framerate = framerate
+        self.quality = quality
+
+        self._jpeg = None
+        self._sequence = 0
+        self._jpeg_available = threading.Condition()
+
+        self._clients = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # statistics
+        self.frames_encoded = 0
+
+    @property
+    def clients(self) -> int:
+        return self._clients
+
+    def open(self):
+        with self._lock:
+            self._clients += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._lock:
+            self._clients = max(0, self._clients - 1)
+
+    def wait_for_jpeg(self, sequence: int, timeout: float = 1.0) -> tuple[int, Optional[bytes]]:
+        """
+        Wait for a frame newer than the given sequence number. Returns the new sequence number and the JPEG data or None if
+        no new frame was encoded within the timeout.
+        """
+        with self._jpeg_available:
+            if not self._jpeg_available.wait_for(lambda: self._sequence != sequence, timeout):
+                return sequence, None
+
+            return self._sequence, self._jpeg
+
+    def encode(self, frame) -> Optional[bytes]:
+        h, w = frame.shape[:2]
+        if (w, h) != self.resolution:
+            frame = cv2.resize(frame, self.resolution, interpolation=cv2.INTER_AREA)
+
+        ret, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        return jpeg.tobytes() if ret else None
+
+    def _run(self):
+        # run with the lowest priority, so the encoder never competes with the capture and processing threads
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError) as e:
+            logging.debug(f"Failed to lower the stream encoder priority: {e}")
+
+        interval = 1 / self.framerate
+
+        while True:
+            with self._lock:
+                if self._clients == 0:
+                    self._thread = None
+                    return
+
+            t0 = time.monotonic()
+
+            jpeg = self.encode(self._camera.wait_for_debug_frame())
+            if jpeg is not None:
+                with self._jpeg_available:
+                    self._jpeg = jpeg
+                    self._sequence += 1
+                    self.frames_encoded += 1
+                    self._jpeg_available.notify_all()
+
+            # limit the frame rate
+            time.sleep(max(0.0, interval - (time.monotonic() - t0)))
@@ -0,0 +1,179 @@
+import os
+import pty
+import tty
+import time
+import select
+import logging
+import threading
+import numpy as np
+
+
+class FirmwareSimulator:
+    """
+    Simulates the firmware side of the IPC protocol on a pseudo-terminal. The port name can be used like the real UART.
+    Received bytes are consumed at the configured baud rate, so the sender sees the same backpressure as on the real link.
+    """
+
+    VERSION = (1, 0)
+    VOLTAGE = (5, 0)
+
+    def __init__(self, size: int = 32, baudrate: int = 115200, latency: float = 0.0):
+        self._size = size
+        self._baudrate = baudrate
+        self._latency = latency
+
+        # open the pseudo-terminal. The slave side is used by the IPC controller
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        # laser state. Fades are evaluated when the brightness is queried
+        self._fade_start = np.zeros(size, dtype=np.float64)
+        self._fade_target = np.zeros(size, dtype=np.float64)
+        self._fade_time = np.zeros(size, dtype=np.float64)
+        self._fade_duration = np.zeros(size, dtype=np.float64)
+        self.animation = None
+
+        self._partial = bytearray()
+        self._lock = threading.Lock()
+
+        # statistics
+        self.bytes_received = 0
+        self.packets_received = 0
+        self.packets_invalid = 0
+        self.standby = False
+
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join(timeout=1)
+        self._thread = None
+
+        os.close(self._master)
+        os.close(self._slave)
+
+    def brightness(self, index: int) -> int:
+        with self._lock:
+            duration = self._fade_duration[index]
+            progress = 1.0 if duration == 0 else np.clip((time.monotonic() - self._fade_time[index]) / duration, 0.0, 1.0)
+            return int(round(self._fade_start[index] + (self._fade_target[index] - self._fade_start[index]) * progress))
+
+    def press(self, sequence: str):
+        """
+        Send a button sequence (e. g. "sxx") to the IPC controller.
+        """
+        self._respond(bytes([0x90]) + sequence.encode("utf-8")[:3].ljust(3, b"x"))
+
+    def _respond(self, data: bytes):
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+        os.write(self._master, data)
+
+    def _set(self, index: int, brightness: int, fade: int):
+        if not 0 <= index < self._size:
+            return
+
+        current = self.brightness(index)
+        with self._lock:
+            self._fade_start[index] = current
+            self._fade_target[index] = brightness
+            self._fade_time[index] = time.monotonic()
+            self._fade_duration[index] = fade / 10
+
+    def _handle(self, packet: bytes):
+        self.packets_received += 1
+        status = packet[0]
+
+        if status == 0x80:
+            self._set(packet[1], packet[2], packet[3])
+        elif status == 0x81:
+            for i in range(self._size):
+                self._set(i, packet[1], packet[2])
+        elif status == 0x82:
+            self._respond(bytes([0x82, packet[1], self.brightness(packet[1]) if packet[1] < self._size else 0, 0x00]))
+        elif status == 0x83:
+            self.animation = packet[1:]
+        elif status == 0x84:
+            self.animation = None
+        elif status == 0x91:
+            self._respond(bytes([0x91, 0x00, *self.VOLTAGE]))
+        elif status == 0xF0:
+            self._respond(bytes([0xF0, *self.VERSION, 0x00]))
+        elif status == 0xF1:
+            # reboot
+            for i in range(self._size):
+                self._set(i, 0, 0)
+            self.animation = None
+            self.standby = False
+        elif status == 0xF2:
+            self.standby = True
+        else:
+            self.packets_invalid += 1
+            logging.warning(f"Simulator received unknown packet: {packet.hex(' ')}")
+
+    def _run(self):
+        # consume the data in small chunks at the configured baud rate (8N1: 10 bits per byte)
+        chunk_size = 16
+        byte_time = 10 / self._baudrate
+
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+
+            try:
+                data = os.read(self._master, chunk_size)
+            except OSError:
+                break
+
+            start = time.monotonic()
+            self.bytes_received += len(data)
+
+            # frame the packets. A byte with the high bit set always starts a new packet
+            for byte in data:
+                if byte & 0x80:
+                    if self._partial:
+                        self.packets_invalid += 1
+                    self._partial.clear()
+                elif not self._partial:
+                    continue
+
+                self._partial.append(byte)
+                if len(self._partial) == 4:
+                    self._handle(bytes(self._partial))
+                    self._partial.clear()
+
+            # throttle to the baud rate
+            remaining = len(data) * byte_time - (time.monotonic() - start)
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    with FirmwareSimulator() as simulator:
+        print(f"Firmware simulator listening on {simulator.port}. Press Ctrl+C to exit.")
+
+        try:
+            while True:
+                time.sleep(1)
+                print(f"received {simulator.bytes_received} bytes, {simulator.packets_received} packets ({simulator.packets_invalid} invalid)")
+        except KeyboardInterrupt:
+            pass
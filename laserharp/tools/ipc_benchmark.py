@@ -0,0 +1,68 @@
+import time
+import numpy as np
+from perci import reactive
+from ..ipc import IPCController
+from ..laser_array import LaserArray
+from .firmware_simulator import FirmwareSimulator
+
+
+def benchmark(baudrate: int = 115200, latency: float = 0.0, size: int = 11, duration: float = 2.0, update_rate: float = 2000.0):
+    with FirmwareSimulator(size=size, baudrate=baudrate, latency=latency) as simulator:
+        global_state = reactive(
+            {
+                "ipc": {"config": {"port": simulator.port, "baudrate": baudrate}, "settings": {}, "state": {}},
+                "laser_array": {"config": {"size": size}, "settings": {}, "state": {}},
+            }
+        )
+
+        ipc = IPCController("ipc", global_state)
+        laser_array = LaserArray("laser_array", global_state, ipc)
+        ipc.start()
+
+        # flood the link with brightness updates, like a brightness automation over midi
+        rng = np.random.default_rng(0)
+        updates = 0
+        call_times = []
+        start = time.monotonic()
+
+        while time.monotonic() - start < duration:
+            t0 = time.perf_counter()
+            laser_array.set(int(rng.integers(size)), int(rng.integers(128)))
+            call_times.append(time.perf_counter() - t0)
+            updates += 1
+
+            time.sleep(1 / update_rate)
+
+        # measure the round trip time of a brightness query once the link is idle
+        time.sleep(0.2)
+        round_trips = []
+        for i in range(20):
+            t0 = time.perf_counter()
+            ipc.send_raw(bytes([0x82, i % size, 0x00, 0x00]))
+            if ipc.read_raw(timeout=1.0) is not None:
+                round_trips.append(time.perf_counter() - t0)
+
+        ipc.stop()
+
+        # the final state must match, regardless of how many updates were coalesced
+        time.sleep(0.1)
+        consistent = all(simulator.brightness(i) == laser_array[i] for i in range(size))
+
+        return {
+            "updates": updates,
+            "packets": simulator.packets_received - len(round_trips),
+            "coalesced": ipc.coalesced,
+            "throughput": simulator.bytes_received / duration,
+            "call_max": max(call_times),
+            "round_trip_p50": float(np.median(round_trips)) if round_trips else None,
+            "consistent": consistent,
+        }
+
+
+if __name__ == "__main__":
+    for latency in [0.0, 0.002]:
+        result = benchmark(latency=latency)
+        print(f"latency {latency * 1e3:.0f} ms:")
+        print(f"  {result['updates']} updates -> {result['packets']} packets ({result['coalesced']} coalesced)")
+        print(f"  throughput {result['throughput']:.0f} B/s, max send() call {result['call_max'] * 1e6:.0f} us")
+        print(f"  round trip p50 {result['round_trip_p50'] * 1e3:.2f} ms, final state consistent: {result['consistent']}")
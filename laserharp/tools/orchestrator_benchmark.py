@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from perci import reactive
+from ..config import load_config
+from ..ipc import IPCController
+from ..din_midi import DinMidi
+from ..laser_array import LaserArray
+from ..image_processor import ImageProcessor
+from ..orchestrator import Orchestrator
+
+
+def benchmark(config: dict, num_beams: int, num_frames: int = 10000, pluck_probability: float = 0.05):
+    # run all hardware interfaces in disabled mode
+    settings = {key: value["default"] for key, value in config["orchestrator"]["settings"].items()}
+    global_state = reactive(
+        {
+            "ipc": {"config": {"enabled": False}, "settings": {}, "state": {}},
+            "din_midi": {"config": {"enabled": False}, "settings": {}, "state": {}},
+            "laser_array": {"config": {"size": num_beams}, "settings": {}, "state": {}},
+            "orchestrator": {"config": {}, "settings": settings, "state": {}},
+        }
+    )
+
+    ipc = IPCController("ipc", global_state)
+    din_midi = DinMidi("din_midi", global_state)
+    laser_array = LaserArray("laser_array", global_state, ipc)
+    orchestrator = Orchestrator("orchestrator", global_state, laser_array, din_midi)
+    orchestrator.start()
+
+    # generate a sequence of frames where each beam toggles its state with the given probability
+    rng = np.random.default_rng(0)
+    toggles = rng.random((num_frames, num_beams)) < pluck_probability
+    active = np.logical_xor.accumulate(toggles, axis=0)
+    results = [
+        ImageProcessor.Result(
+            active=active[i],
+            length=np.where(active[i], 0.5, np.nan),
+            modulation=np.where(active[i], rng.uniform(-0.1, 0.1, num_beams), 0.0),
+        )
+        for i in range(num_frames)
+    ]
+
+    start = time.perf_counter()
+    for result in results:
+        orchestrator.process(result, 0.02)
+    duration = time.perf_counter() - start
+
+    orchestrator.stop()
+
+    return duration / num_frames
+
+
+if __name__ == "__main__":
+    config = load_config(config_logging=False)
+
+    for n in [11, 32, 64]:
+        print(f"{n:3d} beams: {benchmark(config, n) * 1e6:8.2f} us per frame")
@@ -5,6 +5,7 @@ import cv2
 from perci import ReactiveDictNode
 from laserharp.ipc import IPCController
 from laserharp.camera import Camera
+from laserharp.din_midi import DinMidi
 
 
 # pylint: disable=duplicate-code
@@ -12,6 +13,13 @@ class MockSerial:
     def __init__(self):
         self.txdata = bytearray()
         self.rxdata = bytearray()
+        self.is_open = True
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
 
     def clear(self):
         self.txdata = bytearray()
@@ -71,6 +79,25 @@ class MockIPCController(IPCController):
         return data
 
 
+# pylint: disable=duplicate-code
+class MockDinMidi(DinMidi):
+    def __init__(self, name: str, global_state: ReactiveDictNode):
+        super().__init__(name, global_state, MockSerial())
+
+    @property
+    def txdata(self):
+        return self._serial.txdata
+
+    def clear(self):
+        self._serial.clear()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
 # pylint: disable=duplicate-code
 class MockCamera(Camera):
     def __init__(self, name: str, global_state: ReactiveDictNode):
@@ -95,11 +122,14 @@ class MockCamera(Camera):
     def save(self, filename: str):
         cv2.imwrite(str(filename), self.frame)
 
-    def capture(self):
+    def capture(self, **_kwargs):
         # simulate capture delay
         time.sleep(1 / self.framerate)
 
         return self.frame
 
-    def start_debug_stream(self):
-        raise NotImplementedError("Debug stream not implemented for MockCamera")
+    def wait_for_debug_frame(self, **_kwargs):
+        # simulate capture delay
+        time.sleep(1 / self.framerate)
+
+        return self.frame
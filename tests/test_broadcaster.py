@@ -0,0 +1,148 @@
+import unittest
+import struct
+from types import SimpleNamespace
+import numpy as np
+from perci import reactive
+
+try:
+    from laserharp.server.broadcaster import StateBroadcaster, coalesce_changes
+
+    SERVER_AVAILABLE = True
+except ImportError:
+    SERVER_AVAILABLE = False
+
+
+class MockSocketIO:
+    def __init__(self):
+        self.server = self
+        self.rooms = {}
+        self.emitted = []
+
+    def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(room, set()).discard(sid)
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+
+@unittest.skipUnless(SERVER_AVAILABLE, "server dependencies are not available")
+class TestStateBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive({"image_processor": {"state": {"result": {"active": [False, False], "length": [0.0, 0.0], "modulation": [0.0, 0.0]}, "status": "stopped"}}})
+        self.socketio = MockSocketIO()
+        self.broadcaster = StateBroadcaster(self.socketio, self.global_state)
+
+    def tearDown(self):
+        self.broadcaster.stop()
+
+    def test_coalescing(self):
+        self.broadcaster.add_client("a")
+        self.broadcaster.add_client("b")
+        self.assertEqual(self.socketio.rooms[StateBroadcaster.ROOM], {"a", "b"})
+        self.assertEqual([to for _, _, to in self.socketio.emitted], ["a", "b"])
+        self.socketio.emitted.clear()
+
+        state = self.global_state["image_processor"]["state"]
+        for i in range(10):
+            state["result"]["length"][0] = i * 0.1
+        state["status"] = "running"
+        state["result"]["length"][0] = 0.5
+
+        self.broadcaster.tick()
+
+        # a single payload for all clients with the last value of each path
+        self.assertEqual(len(self.socketio.emitted), 1)
+        event, payload, to = self.socketio.emitted[0]
+        self.assertEqual((event, to), ("app:global_state:changes", StateBroadcaster.ROOM))
+        self.assertEqual([(change["path"][-1], change["value"]) for change in payload], [("status", "running"), (0, 0.5)])
+        self.assertEqual(self.broadcaster.changes_received, 12)
+
+        # nothing changed since the last tick
+        self.broadcaster.tick()
+        self.assertEqual(len(self.socketio.emitted), 1)
+
+    def test_structural_changes(self):
+        changes = [
+            SimpleNamespace(change_type="add", path=["root", "a"], key="x"),
+            SimpleNamespace(change_type="update", path=["root", "a", "x"], value=1),
+            SimpleNamespace(change_type="add", path=["root", "a"], key="y"),
+            SimpleNamespace(change_type="update", path=["root", "a", "x"], value=2),
+        ]
+
+        # updates are not merged across structural changes
+        self.assertEqual(coalesce_changes(changes), changes)
+
+    def test_add_and_update(self):
+        changes = [
+            SimpleNamespace(change_type="add", path=["root", "a"], key="x"),
+            SimpleNamespace(change_type="update", path=["root", "a"], value={"x": 1}),
+        ]
+
+        # an update of the same path does not replace the add
+        self.assertEqual(coalesce_changes(changes), changes)
+
+    def test_remove_and_add(self):
+        changes = [
+            SimpleNamespace(change_type="update", path=["root", "a", "x"], value=1),
+            SimpleNamespace(change_type="remove", path=["root", "a"], key="x"),
+            SimpleNamespace(change_type="add", path=["root", "a"], key="x"),
+            SimpleNamespace(change_type="update", path=["root", "a", "x"], value=2),
+        ]
+
+        # the key is removed and added again in order, the updates around it are kept
+        self.assertEqual(coalesce_changes(changes), changes)
+
+    def test_list_insert(self):
+        changes = [
+            SimpleNamespace(change_type="update", path=["root", "l", 0], value=1),
+            SimpleNamespace(change_type="update", path=["root", "l", 0], value=2),
+            SimpleNamespace(change_type="add", path=["root", "l"], key=0),
+            SimpleNamespace(change_type="update", path=["root", "l", 0], value=3),
+            SimpleNamespace(change_type="update", path=["root", "l", 1], value=4),
+            SimpleNamespace(change_type="update", path=["root", "l", 0], value=5),
+        ]
+
+        # the insert shifts the indices, so only the updates within each run are merged
+        self.assertEqual(coalesce_changes(changes), [changes[1], changes[2], changes[4], changes[5]])
+
+    def test_binary(self):
+        self.broadcaster.add_client("a")
+        self.broadcaster.add_client("b")
+        self.assertEqual(self.broadcaster.subscribe("b", "binary")["layout"], [["length", "float32"], ["modulation", "float32"], ["active", "uint8"]])
+        self.assertRaises(ValueError, self.broadcaster.subscribe, "b", "xml")
+        self.broadcaster.tick()
+        self.socketio.emitted.clear()
+
+        state = self.global_state["image_processor"]["state"]
+        state["result"]["length"][1] = 0.25
+        state["status"] = "running"
+        self.broadcaster.tick()
+
+        emitted = {(event, to): data for event, data, to in self.socketio.emitted}
+        self.assertEqual(len(emitted[("app:global_state:changes", StateBroadcaster.ROOM)]), 2)
+
+        # binary clients receive the result as typed arrays and all other changes as usual
+        self.assertEqual([change["path"][-1] for change in emitted[("app:global_state:changes", StateBroadcaster.BINARY_ROOM)]], ["status"])
+
+        data = emitted[("app:global_state:result", StateBroadcaster.BINARY_ROOM)]
+        (count,) = struct.unpack_from("<I", data)
+        self.assertEqual(count, 2)
+        self.assertEqual(np.frombuffer(data, dtype="<f4", count=count, offset=4).tolist(), [0.0, 0.25])
+        self.assertEqual(len(data), 4 + count * 9)
+
+    def test_no_clients(self):
+        self.broadcaster.add_client("a")
+        self.broadcaster.remove_client("a")
+        self.socketio.emitted.clear()
+
+        # without clients, changes are not watched at all
+        self.global_state["image_processor"]["state"]["status"] = "running"
+        self.broadcaster.tick()
+        self.assertEqual(self.socketio.emitted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
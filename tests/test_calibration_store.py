@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+from laserharp.calibration_store import CalibrationStore
+
+
+class TestCalibrationStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CalibrationStore(self.directory.name, history=3)
+        self.config_hash = CalibrationStore.config_hash({"laser_array": {"size": 3}, "camera": {"resolution": (640, 480)}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_config_hash(self):
+        # tuples and lists must result in the same hash
+        self.assertEqual(self.config_hash, CalibrationStore.config_hash({"camera": {"resolution": [640, 480]}, "laser_array": {"size": 3}}))
+        self.assertNotEqual(self.config_hash, CalibrationStore.config_hash({"laser_array": {"size": 4}, "camera": {"resolution": (640, 480)}}))
+
+    def test_save_load(self):
+        self.assertIsNone(self.store.load(self.config_hash))
+
+        data = {"ya": np.float32(-10), "a": np.array([0.1, 0.2, 0.3], dtype=np.float32), "beam_yv": np.arange(5, dtype=np.int32)[:, np.newaxis]}
+        record = self.store.save(self.config_hash, data, {"coverage_min": 0.8})
+
+        loaded = self.store.load(self.config_hash)
+        self.assertEqual(loaded.id, record.id)
+        self.assertEqual(loaded.quality, {"coverage_min": 0.8})
+        self.assertEqual(set(loaded.data.keys()), set(data.keys()))
+        self.assertEqual(loaded.data["a"].dtype, np.float32)
+        self.assertTrue(np.array_equal(loaded.data["beam_yv"], data["beam_yv"]))
+
+        # other configurations do not see the calibration
+        self.assertIsNone(self.store.load(CalibrationStore.config_hash({})))
+
+    def test_history(self):
+        ids = [self.store.save(self.config_hash, {"ya": np.float32(i)}).id for i in range(5)]
+
+        # only the most recent calibrations are kept, newest first
+        self.assertEqual(self.store.entries(self.config_hash), ids[:1:-1])
+        self.assertIsNone(self.store.load(self.config_hash, ids[0]))
+        self.assertEqual(float(self.store.load(self.config_hash, ids[3]).data["ya"]), 3.0)
+
+    def test_summaries(self):
+        records = [self.store.save(self.config_hash, {"ya": np.float32(i)}, {"coverage_min": i / 10}) for i in range(2)]
+
+        # newest first, without the calibration data
+        self.assertEqual(self.store.summaries(self.config_hash), [record.summary() for record in records[::-1]])
+
+    def test_corrupt(self):
+        record = self.store.save(self.config_hash, {"ya": np.float32(0)})
+
+        with open(os.path.join(self.directory.name, self.config_hash, record.id + ".npz"), "wb") as f:
+            f.write(b"not an archive")
+
+        self.assertIsNone(self.store.load(self.config_hash))
+
+
+if __name__ == "__main__":
+    unittest.main()
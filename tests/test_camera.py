@@ -2,8 +2,9 @@ import unittest
 import time
 import logging
 import cv2
+import numpy as np
 from perci import reactive
-from laserharp.camera import Camera
+from laserharp.camera import Camera, FramePool, FrameRateCounter
 from . import OUTPUT_DIRECTORY
 
 
@@ -90,5 +91,111 @@ class TestCamera(unittest.TestCase):
         cv2.imwrite(str(OUTPUT_DIRECTORY / "test_camera_capture.png"), frame)
 
 
+class TestFramePool(unittest.TestCase):
+    def setUp(self):
+        self.pool = FramePool(3, (4, 4))
+
+    def _produce(self, value: int):
+        index, buffer = self.pool.acquire()
+        buffer[:] = value
+        self.pool.publish(index)
+
+    def test_latest_frame_wins(self):
+        # publish three frames without consuming any of them
+        for value in range(1, 4):
+            self._produce(value)
+
+        # only the latest frame should be handed over
+        frame = self.pool.take(timeout=0.1)
+        self.assertTrue(np.all(frame == 3))
+        self.assertEqual(self.pool.dropped, 2)
+
+        # no new frame is available
+        with self.assertRaises(TimeoutError):
+            self.pool.take(timeout=0.1)
+
+    def test_buffer_reuse(self):
+        # the frame taken by the consumer must not be overwritten by the producer
+        self._produce(1)
+        frame = self.pool.take(timeout=0.1)
+
+        for value in range(2, 10):
+            self._produce(value)
+
+        self.assertTrue(np.all(frame == 1))
+        self.assertTrue(np.all(self.pool.take(timeout=0.1) == 9))
+
+
+class TestRegionOfInterest(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive({"camera": {"config": {"resolution": [640, 480], "framerate": 50}, "settings": {}, "state": {}}})
+        self.camera = Camera("camera", self.global_state, skip_hardware_init=True)
+
+    def test_buffer_reuse(self):
+        frame = np.zeros((480, 640), dtype=np.uint8)
+        frame[200:210, 100:110] = 255
+        frame[200:210, 500:510] = 255
+
+        self.camera.set_roi([(50, 0, 150, 480)])
+        points = self.camera._detect_points_roi(frame, self.camera._roi)  # pylint: disable=protected-access
+        self.assertGreater(np.max(points[:, 50:150]), 0)
+
+        # the same buffer is used for every frame
+        self.assertIs(self.camera._detect_points_roi(frame, self.camera._roi), points)  # pylint: disable=protected-access
+
+        # new regions start with a cleared buffer
+        self.camera.set_roi([(450, 0, 550, 480)])
+        points = self.camera._detect_points_roi(frame, self.camera._roi)  # pylint: disable=protected-access
+        self.assertEqual(np.max(points[:, :450]), 0)
+        self.assertGreater(np.max(points[:, 450:550]), 0)
+
+
+class TestFrameRateCounter(unittest.TestCase):
+    def setUp(self):
+        self.counter = FrameRateCounter(update_interval=1.0, nominal_interval=0.02, window=100)
+        self.rates = []
+        self.counter.on("update", self.rates.append)
+
+    def test_frame_rate(self):
+        for i in range(100):
+            self.counter.count_frame(i * 0.02)
+
+        self.assertEqual(self.counter.get_frame_count(), 100)
+        self.assertEqual(len(self.rates), 1)
+        self.assertAlmostEqual(self.rates[0], 50.0)
+
+    def test_jitter(self):
+        # a single stall of 3 frame periods
+        timestamps = [i * 0.02 for i in range(50)] + [1.04 + i * 0.02 for i in range(50)]
+        for timestamp in timestamps:
+            self.counter.count_frame(timestamp)
+
+        stats = self.counter.get_interval_stats()
+        self.assertAlmostEqual(stats["p50"], 20.0)
+        self.assertAlmostEqual(stats["max"], 60.0)
+        self.assertEqual(stats["late"], 1)
+        self.assertEqual(stats["window"], 99)
+
+    def test_stall(self):
+        for i in range(60):
+            self.counter.count_frame(i * 0.02)
+        self.rates.clear()
+
+        # nothing is published while frames keep arriving
+        now = time.monotonic()
+        self.counter.poll(now)
+        self.assertEqual(self.rates, [])
+
+        # without new frames, the frame rate drops to 0 and the stats are marked as stalled
+        self.counter.poll(now + 1.5)
+        self.counter.poll(now + 3.0)
+        self.assertEqual(self.rates[-1], 0.0)
+        self.assertTrue(self.counter.get_interval_stats()["stalled"])
+
+        # a new frame clears the stall
+        self.counter.count_frame(5.0)
+        self.assertFalse(self.counter.get_interval_stats()["stalled"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from perci import reactive
+from laserharp.midi import MidiEvent
+from .mocks import MockDinMidi
+
+
+class TestDinMidi(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "din_midi": {
+                    "config": {},
+                    "settings": {},
+                    "state": {},
+                },
+            }
+        )
+
+        self.din_midi = MockDinMidi("din_midi", self.global_state)
+
+    def test_send(self):
+        self.din_midi.send(MidiEvent(0, "note_on", note=60, velocity=100))
+        self.din_midi.send(MidiEvent(0, "note_on", note=62, velocity=100))
+
+        # every write starts with a status byte
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 60, 100, 0x90, 62, 100]))
+
+    def test_running_status(self):
+        self.din_midi.queue(MidiEvent(0, "note_on", note=60, velocity=100))
+        self.din_midi.queue(MidiEvent(0, "note_off", note=60))
+        self.din_midi.queue(MidiEvent(0, "note_on", channel=1, note=60, velocity=100))
+        self.din_midi.queue(MidiEvent(0, "pitchwheel", channel=1, pitch=0))
+        self.din_midi.queue(MidiEvent(0, "pitchwheel", channel=1, pitch=8191))
+
+        # nothing is sent before flushing
+        self.assertEqual(self.din_midi.txdata, b"")
+
+        # note off is sent as note on with velocity 0
+        self.din_midi.flush()
+        self.assertEqual(
+            self.din_midi.txdata,
+            bytes([0x90, 60, 100, 60, 0, 0x91, 60, 100, 0xE1, 0x00, 0x40, 0x7F, 0x7F]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
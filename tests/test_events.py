@@ -0,0 +1,52 @@
+import unittest
+import threading
+import time
+from laserharp.events import SPSCQueue
+
+
+class TestSPSCQueue(unittest.TestCase):
+    def test_order(self):
+        queue = SPSCQueue(4)
+        for i in range(3):
+            self.assertTrue(queue.put(i))
+
+        self.assertEqual(len(queue), 3)
+        self.assertEqual([queue.get() for _ in range(4)], [0, 1, 2, None])
+
+    def test_overflow(self):
+        queue = SPSCQueue(2)
+        self.assertTrue(queue.put(0))
+        self.assertTrue(queue.put(1))
+        self.assertFalse(queue.put(2))
+        self.assertEqual(queue.overflows, 1)
+
+        # after reading, there is space again
+        self.assertEqual(queue.get(), 0)
+        self.assertTrue(queue.put(3))
+        self.assertEqual([queue.get(), queue.get()], [1, 3])
+
+    def test_concurrent(self):
+        queue = SPSCQueue(8)
+        received = []
+
+        def consume():
+            while len(received) < 10000:
+                item = queue.get()
+                if item is not None:
+                    received.append(item)
+                else:
+                    time.sleep(0)
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+
+        for i in range(10000):
+            while not queue.put(i):
+                time.sleep(0)
+
+        consumer.join(timeout=10)
+        self.assertEqual(received, list(range(10000)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import os
 import time
 from perci import reactive
 from laserharp.ipc import IPCController
+from laserharp.tools.firmware_simulator import FirmwareSimulator
 
 SERIAL_PORT = "/dev/ttyAMA0"
 SERIAL_PORT_AVAILABLE = os.path.exists(SERIAL_PORT) and os.access(SERIAL_PORT, os.W_OK)
@@ -171,5 +172,65 @@ class TestFirmware(unittest.TestCase):
         self.assertEqual(self.ipc.read_raw(), b"\x82\x05\x00\x00")
 
 
+class TestFirmwareSimulator(unittest.TestCase):
+    def setUp(self):
+        self.simulator = FirmwareSimulator(size=8)
+        self.simulator.start()
+
+        self.global_state = reactive(
+            {
+                "ipc": {
+                    "config": {
+                        "port": self.simulator.port,
+                        "baudrate": 115200,
+                    },
+                    "settings": {},
+                    "state": {},
+                },
+            },
+        )
+
+        self.ipc = IPCController("ipc", self.global_state)
+        self.ipc.start()
+
+    def tearDown(self):
+        self.ipc.stop()
+        self.simulator.stop()
+
+    def test_set_brightness(self):
+        self.ipc.send_raw(b"\x81\x7f\x00\x00")
+        self.ipc.send_raw(b"\x80\x05\x00\x00")
+
+        self.ipc.send_raw(b"\x82\x04\x00\x00")
+        self.assertEqual(self.ipc.read_raw(), b"\x82\x04\x7f\x00")
+
+        self.ipc.send_raw(b"\x82\x05\x00\x00")
+        self.assertEqual(self.ipc.read_raw(), b"\x82\x05\x00\x00")
+
+    def test_fade_brightness(self):
+        self.ipc.send_raw(b"\x80\x05\x7f\x02")
+
+        # check if the brightness is somewhere between 0% and 100% halfway through the fade
+        time.sleep(0.1)
+        self.ipc.send_raw(b"\x82\x05\x00\x00")
+        self.assertIn(self.ipc.read_raw()[2], range(1, 127))
+
+    def test_version_inquiry(self):
+        self.ipc.send_raw(b"\xf0\x00\x00\x00")
+        self.assertEqual(self.ipc.read_raw(), b"\xf0\x01\x00\x00")
+
+    def test_button(self):
+        self.simulator.press("sxx")
+        self.assertEqual(self.ipc.read_raw(), b"\x90sxx")
+
+    def test_coalescing(self):
+        # however many updates are coalesced by the writer thread, the latest brightness wins
+        for brightness in range(128):
+            self.ipc.send(bytes([0x80, 0x03, brightness, 0x00]), key=3)
+
+        self.ipc.send_raw(b"\x82\x03\x00\x00")
+        self.assertEqual(self.ipc.read_raw(), b"\x82\x03\x7f\x00")
+
+
 if __name__ == "__main__":
     unittest.main()
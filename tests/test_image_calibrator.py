@@ -1,5 +1,6 @@
 import os
 import unittest
+import tempfile
 import time
 from threading import Thread
 import numpy as np
@@ -14,6 +15,7 @@ from . import OUTPUT_DIRECTORY
 
 class TestImageCalibrator(unittest.TestCase):
     def setUp(self):
+        self.store_directory = tempfile.TemporaryDirectory()
         self.global_state = reactive(
             {
                 "ipc": {
@@ -46,6 +48,8 @@ class TestImageCalibrator(unittest.TestCase):
                         "preblur": 17,
                         "threshold": 100,
                         "min_coverage": 0.6,
+                        "store_directory": self.store_directory.name,
+                        "history": 2,
                     },
                     "settings": {},
                     "state": {},
@@ -61,7 +65,7 @@ class TestImageCalibrator(unittest.TestCase):
         self.calibration = None
 
     def tearDown(self):
-        pass
+        self.store_directory.cleanup()
 
     def _do_calibration(self):
         self.calibration = self.image_calibrator.calibrate()
@@ -94,7 +98,7 @@ class TestImageCalibrator(unittest.TestCase):
         self.assertFalse(self.image_calibrator.load())
 
     def test_load(self):
-        # write a sample config
+        # write a sample config in the legacy format with straight beam lines
         self.image_calibrator.settings["calibration_data"] = json.dumps(
             {
                 "required_config": self.image_calibrator.required_config(),
@@ -113,30 +117,67 @@ class TestImageCalibrator(unittest.TestCase):
         # check the values
         self.assertAlmostEqual(self.image_calibrator.calibration.ya, -10, delta=0.01)
         self.assertAlmostEqual(self.image_calibrator.calibration.yb, 200, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.x0[0], 250, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.x0[1], 350, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.x0[2], 450, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.m[0], -0.2, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.m[1], 0.0, delta=0.01)
-        self.assertAlmostEqual(self.image_calibrator.calibration.m[2], 0.2, delta=0.01)
+        self.assertEqual(self.image_calibrator.calibration.a.tolist(), [0, 0, 0])
+        self.assertAlmostEqual(self.image_calibrator.calibration.b[0], -0.2, delta=0.01)
+        self.assertAlmostEqual(self.image_calibrator.calibration.b[1], 0.0, delta=0.01)
+        self.assertAlmostEqual(self.image_calibrator.calibration.b[2], 0.2, delta=0.01)
+        self.assertAlmostEqual(self.image_calibrator.calibration.c[0], 250, delta=0.01)
+        self.assertAlmostEqual(self.image_calibrator.calibration.c[1], 350, delta=0.01)
+        self.assertAlmostEqual(self.image_calibrator.calibration.c[2], 450, delta=0.01)
+
+        # the legacy calibration is migrated to the calibration store
+        self.assertEqual(self.image_calibrator.settings["calibration_data"], "{}")
+        self.assertEqual(len(self.image_calibrator.state["history"]), 1)
 
     def test_save(self):
         # store the config
-        self.image_calibrator.calibration = Calibration(ya=-20, yb=300, x0=[150, 250, 350], m=[-0.3, 0.0, 0.3])
+        self.image_calibrator.calibration = Calibration(ya=-20, yb=300, a=[0, 0, 0], b=[-0.3, 0.0, 0.3], c=[150, 250, 350])
+        self.image_calibrator.save({"y_metric": np.linspace(0, 1, 10)})
+
+        # load it into a new calibrator
+        image_calibrator = ImageCalibrator("image_calibrator", self.global_state, self.laser_array, self.camera)
+        self.assertTrue(image_calibrator.load())
+
+        self.assertAlmostEqual(image_calibrator.calibration.ya, -20, delta=0.01)
+        self.assertAlmostEqual(image_calibrator.calibration.yb, 300, delta=0.01)
+        self.assertEqual(image_calibrator.calibration.b.tolist(), np.float32([-0.3, 0.0, 0.3]).tolist())
+        self.assertEqual(image_calibrator.calibration.c.tolist(), [150, 250, 350])
+        self.assertTrue(np.array_equal(image_calibrator.grids["y_metric"], np.linspace(0, 1, 10)))
+        self.assertEqual(len(image_calibrator.state["history"]), 1)
+
+    def test_rollback(self):
+        for c in [100, 200, 300]:
+            self.image_calibrator.calibration = Calibration(ya=0, yb=480, a=[0, 0, 0], b=[0, 0, 0], c=[c, c + 10, c + 20])
+            self.image_calibrator.save()
+
+        # only the last two calibrations are kept
+        self.assertEqual(len(self.image_calibrator.state["history"]), 2)
+
+        self.assertTrue(self.image_calibrator.rollback())
+        self.assertEqual(self.image_calibrator.calibration.c[0], 200)
+
+        # there is no calibration before the oldest one
+        self.assertFalse(self.image_calibrator.rollback())
+
+        # restore a specific calibration
+        self.assertTrue(self.image_calibrator.rollback(self.image_calibrator.state["history"][0]["id"]))
+        self.assertEqual(self.image_calibrator.calibration.c[0], 300)
+
+    def test_quality_missing_beam(self):
+        # the second beam could not be fitted, so it has no residual
+        quality = ImageCalibrator._quality(np.array([0.8, 0.3, 0.9]), np.array([0.2, np.nan, 0.4]))
+        self.assertAlmostEqual(quality["residual_max"], 0.4)
+        self.assertAlmostEqual(quality["residual_mean"], 0.3)
+
+        # no beam was fitted at all
+        self.assertIsNone(ImageCalibrator._quality(np.zeros(3), np.full(3, np.nan))["residual_max"])
+
+        # the quality is stored and published as valid json
+        self.image_calibrator.calibration = Calibration(ya=0, yb=480, a=[0, 0, 0], b=[0, 0, 0], c=[100, 200, 300])
+        self.image_calibrator.quality = quality
         self.image_calibrator.save()
-
-        # check the output file
-        config = json.loads(self.image_calibrator.settings["calibration_data"])
-        calibration = config["calibration"]
-
-        self.assertAlmostEqual(calibration["ya"], -20, delta=0.01)
-        self.assertAlmostEqual(calibration["yb"], 300, delta=0.01)
-        self.assertAlmostEqual(calibration["x0"][0], 150, delta=0.01)
-        self.assertAlmostEqual(calibration["x0"][1], 250, delta=0.01)
-        self.assertAlmostEqual(calibration["x0"][2], 350, delta=0.01)
-        self.assertAlmostEqual(calibration["m"][0], -0.3, delta=0.01)
-        self.assertAlmostEqual(calibration["m"][1], 0.0, delta=0.01)
-        self.assertAlmostEqual(calibration["m"][2], 0.3, delta=0.01)
+        json.dumps(self.image_calibrator.state.json(), allow_nan=False)
+        self.assertEqual(self.image_calibrator.store.summaries(self.image_calibrator.config_hash())[0]["quality"], quality)
 
     def test_calibrate(self):
         x0 = np.array([200, 300, 400])
@@ -205,8 +246,15 @@ class TestImageCalibrator(unittest.TestCase):
         self.assertAlmostEqual(self.calibration.yb, 1.5 * 480, delta=0.5, msg="yb")
 
         for i in range(3):
-            self.assertAlmostEqual(self.calibration.x0[i], x0[i], delta=0.5, msg=f"x0[{i}]")
-            self.assertAlmostEqual(self.calibration.m[i], m[i], delta=0.01, msg=f"m[{i}]")
+            self.assertAlmostEqual(self.calibration.a[i], 0.0, delta=0.001, msg=f"a[{i}]")
+            self.assertAlmostEqual(self.calibration.b[i], m[i], delta=0.01, msg=f"b[{i}]")
+            self.assertAlmostEqual(self.calibration.c[i], x0[i], delta=0.5, msg=f"c[{i}]")
+
+        # check the quality metrics
+        quality = self.image_calibrator.quality
+        self.assertGreaterEqual(quality["coverage_min"], self.image_calibrator.config["min_coverage"])
+        self.assertLessEqual(quality["coverage_min"], quality["coverage_mean"])
+        self.assertLess(quality["residual_max"], 1.0)
 
 
 if __name__ == "__main__":
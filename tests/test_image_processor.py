@@ -1,8 +1,10 @@
+import time
 import unittest
+import tracemalloc
 import numpy as np
 from perci import reactive
 from laserharp.laser_array import LaserArray
-from laserharp.image_processor import ImageProcessor
+from laserharp.image_processor import ImageProcessor, PeakRefiner
 from laserharp.image_calibrator import Calibration
 from .mocks import MockIPCController, MockCamera
 
@@ -29,7 +31,10 @@ class TestImageProcessor(unittest.TestCase):
                         "framerate": 60,
                         "mount_distance": 0.2,
                     },
-                    "settings": {},
+                    "settings": {
+                        "shutter_speed": 10000,
+                        "iso": 200,
+                    },
                     "state": {},
                 },
                 "image_processor": {
@@ -41,8 +46,11 @@ class TestImageProcessor(unittest.TestCase):
                         "filter_size": 23,
                         "filter_cutoff": 6,
                         "modulation_gain": 15,
+                        "modulation_delay": 0.0,
+                    },
+                    "settings": {
+                        "threshold": 10,
                     },
-                    "settings": {},
                     "state": {},
                 },
             },
@@ -54,7 +62,7 @@ class TestImageProcessor(unittest.TestCase):
         self.image_processor = ImageProcessor("image_processor", self.global_state, self.laser_array, self.camera)
 
         # set the calibration data
-        calibration = Calibration(ya=0, yb=480, x0=[200, 300, 400], m=[-0.1, 0, 0.1])
+        calibration = Calibration(ya=0, yb=480, a=[0, 0, 0], b=[-0.1, 0, 0.1], c=[200, 300, 400])
         self.image_processor.set_calibration(calibration)
 
         self.ipc.start()
@@ -77,6 +85,53 @@ class TestImageProcessor(unittest.TestCase):
         self.assertEqual(self.image_processor.beam_xv[0].tolist(), [200, 300, 400])
         self.assertEqual(self.image_processor.beam_xv[100].tolist(), [190, 300, 410])
 
+    def test_calibration_grids(self):
+        grids = self.image_processor.calibration_grids()
+        beam_xv = self.image_processor.beam_xv.copy()
+        self.assertEqual(set(grids.keys()), set(ImageProcessor.GRID_KEYS))
+
+        # stored grids are used as they are
+        modified = dict(grids, beam_xv=grids["beam_xv"] + 1)
+        self.image_processor.set_calibration(self.image_processor.calibration, modified)
+        self.assertTrue(np.array_equal(self.image_processor.beam_xv, beam_xv + 1))
+
+        # the remap table is loaded as well
+        beam_map1 = self.image_processor.beam_map1.copy()
+        modified["beam_map1"] = grids["beam_map1"] + 1
+        self.image_processor.set_calibration(self.image_processor.calibration, modified)
+        self.assertTrue(np.array_equal(self.image_processor.beam_map1, beam_map1 + 1))
+
+        # grids of a different mount distance are recomputed
+        modified["mount_distance"] = grids["mount_distance"] + 0.1
+        self.image_processor.set_calibration(self.image_processor.calibration, modified)
+        self.assertTrue(np.array_equal(self.image_processor.beam_xv, beam_xv))
+        self.assertTrue(np.array_equal(self.image_processor.beam_map1, beam_map1))
+
+        # grids of a different band width are recomputed
+        self.image_processor.set_calibration(self.image_processor.calibration, dict(grids, band_width=np.int32(5)))
+        self.assertTrue(np.array_equal(self.image_processor.beam_map1, beam_map1))
+
+    def test_beam_map(self):
+        # the remap table should produce one band of pixels per beam for each row
+        self.assertEqual(self.image_processor.beam_map1.shape[:2], (3 * self.image_processor.band_width, 480))
+
+    def test_roi(self):
+        roi = self.camera._roi  # pylint: disable=protected-access
+        self.assertEqual(len(roi), 3)
+
+        # every sampled beam pixel must lie within one of the strips
+        for y, x in zip(self.image_processor.beam_yv.ravel().tolist() * 3, self.image_processor.beam_xv.T.ravel().tolist()):
+            self.assertTrue(any(x0 <= x < x1 and y0 <= y < y1 for x0, y0, x1, y1 in roi), msg=f"({x}, {y})")
+
+    def test_refine_peak(self):
+        # sample two parabolas with their vertices between two pixel rows
+        y = np.arange(20, dtype=np.float32)[np.newaxis, :]
+        brightness = 255 - (y - np.array([[7.3], [12.8]])) ** 2
+
+        position = PeakRefiner(2).refine(brightness, np.argmax(brightness, axis=1))
+        self.assertAlmostEqual(position[0], 7.3, places=3)
+        self.assertAlmostEqual(position[1], 12.8, places=3)
+
     def test_empty_frame(self):
         # test an empty image. This should return all NaNs
         result = self.image_processor.process(self.camera.capture())
@@ -114,6 +169,125 @@ class TestImageProcessor(unittest.TestCase):
         self.assertGreater(result.modulation[1], 0.1)  # positive modulation
         self.assertAlmostEqual(result.modulation[2], 0.0, places=3)
 
+    def test_publish_result(self):
+        self.camera.draw_blob(300, 240, 10, 255)
+        self.image_processor.process(self.camera.capture())
+
+        # the state is only updated by the ui thread
+        self.image_processor.publish_result()
+        self.assertEqual(self.image_processor.state["result"]["active"].json(), [False, True, False])
+        self.assertEqual(self.image_processor.state["result"]["length"][0], 0.0)
+        self.assertGreater(self.image_processor.state["result"]["length"][1], 0.0)
+
+    def test_ui_thread_survives_errors(self):
+        calls = []
+
+        def publish_result():
+            calls.append(None)
+            raise RuntimeError("publish failed")
+
+        self.image_processor.publish_result = publish_result
+
+        # the thread must keep running after a failed update
+        with self.assertLogs(level="ERROR"):
+            time.sleep(0.2)
+
+        self.assertTrue(self.image_processor._ui_thread.is_alive())
+
+        self.assertGreater(len(calls), 1)
+
+
+class TestImageProcessorAllocations(unittest.TestCase):
+    # use a lot of beams, so that any per-beam temporary outweighs the interpreter's own small allocations
+    NUM_BEAMS = 4096
+
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "ipc": {
+                    "config": {},
+                    "settings": {},
+                    "state": {},
+                },
+                "laser_array": {
+                    "config": {
+                        "size": self.NUM_BEAMS,
+                    },
+                    "settings": {},
+                    "state": {},
+                },
+                "camera": {
+                    "config": {
+                        "resolution": [640, 480],
+                        "framerate": 60,
+                        "mount_distance": 0.2,
+                    },
+                    "settings": {
+                        "shutter_speed": 10000,
+                        "iso": 200,
+                    },
+                    "state": {},
+                },
+                "image_processor": {
+                    "config": {
+                        "length_min": 0.05,
+                        "length_max": 2.0,
+                        "filter_size": 23,
+                        "filter_cutoff": 6,
+                        "modulation_gain": 15,
+                        "modulation_delay": 0.2,
+                    },
+                    "settings": {
+                        "threshold": 10,
+                    },
+                    "state": {},
+                },
+            },
+        )
+
+        self.ipc = MockIPCController("ipc", self.global_state)
+        self.laser_array = LaserArray("laser_array", self.global_state, self.ipc)
+        self.camera = MockCamera("camera", self.global_state)
+        self.image_processor = ImageProcessor("image_processor", self.global_state, self.laser_array, self.camera)
+
+        zeros = np.zeros(self.NUM_BEAMS)
+        self.image_processor.set_calibration(Calibration(ya=0, yb=480, a=zeros, b=zeros, c=np.linspace(20, 620, self.NUM_BEAMS)))
+
+        # prepare a few frames with moving intersections
+        self.frames = []
+        for i in range(4):
+            self.camera.clear()
+            self.camera.draw_blob(100 + i * 120, 200 + i * 5, 10, 255)
+            self.frames.append(self.camera.frame.copy())
+
+    def tearDown(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def test_no_allocations(self):
+        # warm up
+        for i in range(10):
+            self.image_processor.process_frame(self.frames[i % len(self.frames)])
+
+        numpy_filter = [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot().filter_traces(numpy_filter)
+        memory_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        for i in range(50):
+            self.image_processor.process_frame(self.frames[i % len(self.frames)])
+
+        _, memory_peak = tracemalloc.get_traced_memory()
+        snapshot_after = tracemalloc.take_snapshot().filter_traces(numpy_filter)
+
+        # no numpy buffers must be retained between frames
+        size_diff = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, "filename"))
+        self.assertEqual(size_diff, 0)
+
+        # no temporaries must be allocated. Even a boolean mask would add at least one byte per beam to the peak
+        self.assertLess(memory_peak - memory_before, self.NUM_BEAMS)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import os
+import unittest
+import asyncio
+from perci import reactive
+from laserharp.ipc import IPCController
+from .mocks import MockSerial
+
+
+class PipeSerial(MockSerial):
+    def __init__(self):
+        super().__init__()
+
+        # the asynchronous writer writes to the file descriptor directly
+        self.rfd, self.wfd = os.pipe()
+        os.set_blocking(self.wfd, False)
+
+    def fileno(self):
+        return self.wfd
+
+
+class TestIPCController(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "ipc": {
+                    "config": {
+                        "port": "/dev/ttyUSB0",
+                        "baudrate": 115200,
+                        "read_queue_size": 2,
+                    },
+                    "settings": {},
+                    "state": {},
+                },
+            }
+        )
+
+        self.serial = MockSerial()
+        self.ipc = IPCController("ipc", self.global_state, self.serial)
+
+    def test_read(self):
+        self.serial.rxdata += b"\x82\x04\x7f\x00\x90sxx"
+
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x82\x04\x7f\x00")
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x90sxx")
+        self.assertIsNone(self.ipc.read_raw(timeout=0.1))
+
+    def test_partial_packet(self):
+        # an incomplete packet is completed by the next read
+        self.serial.rxdata += b"\x82\x04"
+        self.assertIsNone(self.ipc.read_raw(timeout=0.1))
+
+        self.serial.rxdata += b"\x7f\x00"
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x82\x04\x7f\x00")
+
+    def test_resync(self):
+        # skip the stray data bytes and the packet that lost its last two bytes
+        self.serial.rxdata += b"\x01\x02\x82\x04\x82\x05\x7f\x00"
+
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x82\x05\x7f\x00")
+        self.assertEqual(self.ipc.rx_dropped, 4)
+
+    def test_overflow(self):
+        self.serial.rxdata += b"\x82\x01\x00\x00\x82\x02\x00\x00\x82\x03\x00\x00"
+
+        # the oldest packet is discarded
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x82\x02\x00\x00")
+        self.assertEqual(self.ipc.read_raw(timeout=0.1), b"\x82\x03\x00\x00")
+        self.assertEqual(self.ipc.rx_overflows, 1)
+
+    def test_send_raw_async(self):
+        serial = PipeSerial()
+        ipc = IPCController("ipc", self.global_state, serial)
+        loop = asyncio.new_event_loop()
+
+        async def run():
+            writer = asyncio.create_task(ipc.run_writer_async())
+
+            # send_raw() from another thread is written by the writer task after all pending packets
+            ipc.send(b"\x80\x01\x7f\x00", key=(0x80, 1))
+            await loop.run_in_executor(None, ipc.send_raw, b"\xf2\x64\x05\x00")
+            self.assertEqual(os.read(serial.rfd, 64), b"\x80\x01\x7f\x00\xf2\x64\x05\x00")
+
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+        ipc.use_event_loop(loop)
+        ipc.start()
+        loop.run_until_complete(run())
+        loop.close()
+        ipc.stop()
+
+        os.close(serial.rfd)
+        os.close(serial.wfd)
+
+if __name__ == "__main__":
+    unittest.main()
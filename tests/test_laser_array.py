@@ -96,6 +96,44 @@ class TestLaserArray(unittest.TestCase):
             bytearray([0x80, 3, 64, 0x00]),
         )
 
+    def test_apply(self):
+        # most lasers share the same value, so a single set all packet is used
+        self.laser_array.apply([64, 64, 32])
+        self.assertEqual(
+            self.serial.txdata,
+            bytearray([0x81, 64, 0x00, 0x00]) + bytearray([0x80, 5, 32, 0x00]),
+        )
+
+        # only a single laser changed
+        self.serial.clear()
+        self.laser_array.apply([64, 127, 32])
+        self.assertEqual(self.serial.txdata, bytearray([0x80, 4, 127, 0x00]))
+
+        # nothing changed
+        self.serial.clear()
+        self.laser_array.apply([64, 127, 32])
+        self.assertEqual(self.serial.txdata, bytearray())
+
+    def test_coalescing(self):
+        self.ipc.start()
+
+        # block the writer thread while the updates are queued
+        with self.ipc._write_lock:
+            for brightness in range(10):
+                self.laser_array.set(0, brightness + 1)
+            self.laser_array.set(1, 64)
+            self.laser_array.play_animation("flip", 0.5, "restore")
+            self.laser_array.set(0, 127)
+
+        self.ipc.stop()
+
+        # only the latest brightness of each laser is sent, in the order of the latest update
+        self.assertEqual(
+            self.serial.txdata,
+            bytearray([0x80, 4, 64, 0x00]) + bytearray([0x83, 1, 5, 3]) + bytearray([0x80, 3, 127, 0x00]),
+        )
+        self.assertEqual(self.ipc.coalesced, 10)
+
 
 if __name__ == "__main__":
     unittest.main()
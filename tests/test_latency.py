@@ -0,0 +1,43 @@
+import unittest
+from laserharp.latency import LatencyTracer
+
+
+class TestLatencyTracer(unittest.TestCase):
+    def setUp(self):
+        self.tracer = LatencyTracer(window=100)
+
+    def test_empty(self):
+        summary = self.tracer.summary()
+        self.assertEqual(summary["total"], {"p50": None, "p95": None, "p99": None})
+
+    def test_percentiles(self):
+        # each stage takes 1 ms, the midi write takes i ms
+        for i in range(1, 101):
+            self.tracer.record(0, 1000000, 2000000, 3000000, 4000000, 4000000 + i * 1000000)
+
+        summary = self.tracer.summary()
+        self.assertAlmostEqual(summary["capture"]["p50"], 1.0)
+        self.assertAlmostEqual(summary["orchestrate"]["p99"], 1.0)
+        self.assertAlmostEqual(summary["midi_write"]["p50"], 50.5)
+        self.assertAlmostEqual(summary["total"]["p95"], 99.05)
+
+    def test_missing_write(self):
+        self.tracer.record(0, 1000000, 2000000, 3000000, 4000000, None)
+
+        summary = self.tracer.summary()
+        self.assertAlmostEqual(summary["process"]["p50"], 1.0)
+        self.assertIsNone(summary["total"]["p50"])
+
+    def test_rolling_window(self):
+        for _ in range(100):
+            self.tracer.record(0, 1000000, 2000000, 3000000, 4000000, 5000000)
+        for _ in range(100):
+            self.tracer.record(0, 2000000, 4000000, 6000000, 8000000, 10000000)
+
+        # only the most recent frames are taken into account
+        self.assertEqual(len(self.tracer), 100)
+        self.assertAlmostEqual(self.tracer.summary()["total"]["p50"], 10.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from perci import reactive
+from laserharp.midi_scheduler import MidiScheduler
+from .mocks import MockDinMidi
+
+
+class TestMidiScheduler(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "din_midi": {
+                    "config": {},
+                    "settings": {},
+                    "state": {},
+                },
+            }
+        )
+
+        self.din_midi = MockDinMidi("din_midi", self.global_state)
+        self.scheduler = MidiScheduler(self.din_midi, 7)
+
+    def test_priority(self):
+        self.scheduler.pitchwheel(0, 0)
+        self.scheduler.note_off(0, 60)
+        self.scheduler.note_on(0, 62, 127)
+        self.scheduler.note_on(0, 64, 127)
+
+        # note ons are sent first. The note off still fits using running status
+        self.scheduler.flush()
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 62, 127, 64, 127, 60, 0]))
+        self.assertEqual(self.scheduler.deferred, 1)
+
+        # the pitch bend is sent in the next frame
+        self.din_midi.clear()
+        self.scheduler.flush()
+        self.assertEqual(self.din_midi.txdata, bytes([0xE0, 0x00, 0x40]))
+
+    def test_coalesce_pitchwheel(self):
+        for pitch in range(10):
+            self.scheduler.pitchwheel(0, pitch)
+
+        # only the latest value is sent
+        self.scheduler.flush()
+        self.assertEqual(self.din_midi.txdata, bytes([0xE0, 0x09, 0x40]))
+        self.assertEqual(self.scheduler.coalesced, 9)
+
+    def test_drop_note(self):
+        for note in range(4):
+            self.scheduler.note_on(0, 60 + note, 127)
+
+        # the last note does not fit and is released before it is sent
+        self.scheduler.flush()
+        self.scheduler.note_off(0, 63)
+        self.assertEqual(self.scheduler.dropped, 1)
+
+        self.din_midi.clear()
+        self.scheduler.flush()
+        self.assertEqual(self.din_midi.txdata, b"")
+
+    def test_retrigger(self):
+        self.scheduler.note_off(0, 60)
+        self.scheduler.note_on(0, 60, 100)
+
+        # the note is released before being plucked again
+        self.scheduler.flush()
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 60, 0, 60, 100]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+import numpy as np
+from perci import reactive
+from laserharp.laser_array import LaserArray
+from laserharp.image_processor import ImageProcessor
+from laserharp.orchestrator import Orchestrator
+from laserharp.midi import MidiEvent
+from .mocks import MockIPCController, MockDinMidi
+
+
+class TestOrchestrator(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "ipc": {
+                    "config": {},
+                    "settings": {},
+                    "state": {},
+                },
+                "din_midi": {
+                    "config": {},
+                    "settings": {},
+                    "state": {},
+                },
+                "laser_array": {
+                    "config": {
+                        "size": 3,
+                    },
+                    "settings": {},
+                    "state": {},
+                },
+                "orchestrator": {
+                    "config": {},
+                    "settings": {
+                        "flipped": False,
+                        "modulation_enabled": True,
+                        "blackout_enabled": False,
+                        "unplucked_beam_brightness": 48,
+                        "plucked_beam_brightness": 127,
+                        "key": 0,
+                        "octave": 4,
+                        "mode": 0,
+                    },
+                    "state": {},
+                },
+            }
+        )
+
+        # pylint: disable=duplicate-code
+        self.ipc = MockIPCController("ipc", self.global_state)
+        self.din_midi = MockDinMidi("din_midi", self.global_state)
+        self.laser_array = LaserArray("laser_array", self.global_state, self.ipc)
+        self.orchestrator = Orchestrator("orchestrator", self.global_state, self.laser_array, self.din_midi)
+
+        self.orchestrator.start()
+        self.din_midi.clear()
+
+    def tearDown(self):
+        self.orchestrator.stop()
+
+    def result(self, active, modulation=(0.0, 0.0, 0.0)):
+        return ImageProcessor.Result(
+            active=np.array(active, dtype=bool),
+            length=np.where(active, 0.5, np.nan),
+            modulation=np.array(modulation, dtype=np.float64),
+        )
+
+    def test_note_on_off(self):
+        # C major scale starting at C4 (note 48). Both notes are sent with a single status byte
+        self.orchestrator.process(self.result([True, False, True]), 0.02)
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 48, 127, 52, 127]))
+
+        # nothing changed, so no events should be sent
+        self.din_midi.clear()
+        self.orchestrator.process(self.result([True, False, True]), 0.02)
+        self.assertEqual(self.din_midi.txdata, b"")
+
+        # release the first note and pluck the second one. Note ons are sent first
+        self.orchestrator.process(self.result([False, True, True]), 0.02)
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 50, 127, 48, 0]))
+
+    def test_lookup_tables(self):
+        # C major scale starting at C4
+        self.assertEqual(self.orchestrator._note_lookup_table.tolist(), [48, 50, 52])
+        self.assertEqual(self.orchestrator._note_lookup_table_reverse[50], 1)
+
+        # D dorian starting at D5
+        self.global_state["orchestrator"]["settings"]["key"] = 0
+        self.global_state["orchestrator"]["settings"]["mode"] = 1
+        self.global_state["orchestrator"]["settings"]["octave"] = 5
+        self.global_state["orchestrator"]["settings"]["flipped"] = True
+        self.orchestrator._update_lookup_tables()
+        self.assertEqual(self.orchestrator._note_lookup_table.tolist(), [65, 64, 62])
+        self.assertEqual(self.orchestrator._note_lookup_table_reverse[62], 2)
+
+    def test_release_sounding_notes(self):
+        self.orchestrator.process(self.result([True, False, True]), 0.02)
+        self.din_midi.clear()
+
+        # only the sounding notes are released
+        self.orchestrator.stop()
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 48, 0, 52, 0]))
+
+    def test_panic(self):
+        self.orchestrator.process(self.result([True, False, False]), 0.02)
+        self.din_midi.clear()
+
+        # send all sound off and all notes off
+        self.orchestrator.panic()
+        self.assertEqual(self.din_midi.txdata, bytes([0xB0, 120, 0, 123, 0]))
+
+        # the note is still plucked, so it is triggered again
+        self.din_midi.clear()
+        self.orchestrator.process(self.result([True, False, False]), 0.02)
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 48, 127]))
+
+    def test_midi_input(self):
+        # emulate a plucked beam. The event is only applied at the next frame
+        self.orchestrator.handle_midi_event(MidiEvent(0, "note_on", channel=2, note=50, velocity=20))
+        self.assertEqual(self.din_midi.txdata, b"")
+
+        self.orchestrator.process(self.result([False, False, False]), 0.02)
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 50, 127]))
+        self.assertEqual(self.orchestrator.state["midi_input"]["queue_depth"], 1)
+
+    def test_pitch_bend(self):
+        self.orchestrator.process(self.result([True, True, False], [0.5, 0.0, 0.9]), 0.02)
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 48, 127, 50, 127, 0xE0, 0x00, 0x50]))
+
+    def test_blackout(self):
+        # light the first laser via the brightness channel
+        self.orchestrator.handle_midi_event(MidiEvent(0, "note_on", channel=0, note=48, velocity=100))
+        self.orchestrator.process(self.result([False, False, False]), 0.02)
+        self.assertEqual(list(self.laser_array[:]), [100, 48, 48])
+
+        # blackout turns off all lasers at the next frame, including the one lit via midi
+        self.global_state["orchestrator"]["settings"]["blackout_enabled"] = True
+        self.orchestrator.process(self.result([False, False, False]), 0.02)
+        self.assertEqual(list(self.laser_array[:]), [0, 0, 0])
+
+        # the requested brightness is restored afterwards
+        self.global_state["orchestrator"]["settings"]["blackout_enabled"] = False
+        self.orchestrator.process(self.result([False, False, False]), 0.02)
+        self.assertEqual(list(self.laser_array[:]), [100, 48, 48])
+
+    def test_control_changes(self):
+        settings = self.global_state["orchestrator"]["settings"]
+        settings["flipped"] = True
+        settings["unplucked_beam_brightness"] = 32
+
+        # setting changes are only applied at the next frame boundary
+        self.assertEqual(self.orchestrator._note_lookup_table.tolist(), [48, 50, 52])
+        self.assertEqual(list(self.laser_array[:]), [48, 48, 48])
+
+        self.orchestrator.process(self.result([True, False, False]), 0.02)
+        self.assertEqual(self.orchestrator._note_lookup_table.tolist(), [52, 50, 48])
+        self.assertEqual(list(self.laser_array[:]), [32, 32, 32])
+        self.assertEqual(self.din_midi.txdata, bytes([0x90, 52, 127]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+import os
+from perci import reactive
+from laserharp.store import Store
+from laserharp.settings import SettingsManager
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.directory.name, "store.db")
+        self.store = Store(self.db_file)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_journal_mode(self):
+        self.assertEqual(self.store._db_conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_update_settings(self):
+        self.store.update_settings({"a.b": "1", "a.c": "true"})
+        self.store.update_setting("a.b", "2")
+
+        self.assertEqual(self.store.fetch_settings(), {"a.b": "2", "a.c": "true"})
+        self.assertEqual(self.store.fetch_setting("a.c"), "true")
+        self.assertIsNone(self.store.fetch_setting("a.d"))
+
+    def test_flush_on_stop(self):
+        global_state = reactive(
+            {
+                "orchestrator": {
+                    "config": {
+                        "settings": {
+                            "octave": {"type": "int", "range": [0, 10], "default": 4},
+                        },
+                    },
+                },
+            }
+        )
+
+        settings = SettingsManager(global_state, self.store)
+        settings.setup()
+        settings.start()
+
+        # the change must be stored even though the store thread did not wake up yet
+        settings.set("orchestrator", "octave", 5)
+        settings.stop()
+
+        self.assertEqual(self.store.fetch_setting("orchestrator.octave"), "5")
+
+    def test_restore(self):
+        self.store.update_settings({"orchestrator.octave": "6", "orchestrator.unknown": "1"})
+
+        global_state = reactive(
+            {
+                "orchestrator": {
+                    "config": {
+                        "settings": {
+                            "octave": {"type": "int", "range": [0, 10], "default": 4},
+                            "flipped": {"type": "bool", "default": False},
+                        },
+                    },
+                },
+            }
+        )
+
+        settings = SettingsManager(global_state, self.store)
+        settings.setup()
+
+        self.assertEqual(settings.get("orchestrator", "octave").get_value(), 6)
+        self.assertEqual(settings.get("orchestrator", "flipped").get_value(), False)
+        self.assertEqual(settings.restore_stats["settings"], 2)
+        self.assertEqual(settings.restore_stats["restored"], 1)
+
+        global_state.get_namespace().remove_watcher(settings._watcher)
+
+
+if __name__ == "__main__":
+    unittest.main()
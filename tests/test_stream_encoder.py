@@ -0,0 +1,75 @@
+import unittest
+import time
+import numpy as np
+import cv2
+from perci import reactive
+from laserharp.stream_encoder import StreamEncoder
+from .mocks import MockCamera
+from .utils import wait_until
+
+
+class TestStreamEncoder(unittest.TestCase):
+    def setUp(self):
+        self.global_state = reactive(
+            {
+                "camera": {
+                    "config": {
+                        "resolution": [640, 480],
+                        "framerate": 200,
+                    },
+                    "settings": {
+                        "shutter_speed": 10000,
+                        "iso": 200,
+                    },
+                    "state": {},
+                },
+            }
+        )
+
+        self.camera = MockCamera("camera", self.global_state)
+        self.camera.draw_blob(320, 240, 20, 255)
+        self.encoder = StreamEncoder(self.camera, (320, 240), framerate=20, quality=50)
+
+    def tearDown(self):
+        while self.encoder.clients:
+            self.encoder.close()
+
+    def test_shared_frames(self):
+        self.encoder.open()
+        self.encoder.open()
+
+        # both clients receive the same encoded bytes at the stream resolution
+        sequence_a, jpeg_a = self.encoder.wait_for_jpeg(0)
+        sequence_b, jpeg_b = self.encoder.wait_for_jpeg(0)
+        self.assertIsNotNone(jpeg_a)
+        if sequence_a == sequence_b:
+            self.assertIs(jpeg_a, jpeg_b)
+
+        image = cv2.imdecode(np.frombuffer(jpeg_a, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        self.assertEqual(image.shape, (240, 320))
+        self.assertGreater(image[120, 160], 200)
+
+    def test_rate_limit(self):
+        self.encoder.open()
+        self.encoder.wait_for_jpeg(0)
+
+        # the camera delivers 200 fps, the encoder is capped to 20 fps
+        start = self.encoder.frames_encoded
+        time.sleep(0.5)
+        self.assertLessEqual(self.encoder.frames_encoded - start, 12)
+
+    def test_stops_without_clients(self):
+        self.encoder.open()
+        self.encoder.wait_for_jpeg(0)
+        self.encoder.close()
+
+        # the encoder thread exits once the last client is gone
+        self.assertTrue(wait_until(lambda: self.encoder._thread is None, timeout=1.0))  # pylint: disable=protected-access
+
+        frames = self.encoder.frames_encoded
+        time.sleep(0.2)
+        self.assertEqual(self.encoder.frames_encoded, frames)
+
+
+if __name__ == "__main__":
+    unittest.main()